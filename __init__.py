@@ -1,18 +1,28 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
 from trytond.pool import Pool
-from trytond.model import ModelView
 from . import configurator
+from . import ir
 from . import view
 
 def register():
     Pool.register(
+        configurator.ViewConfiguratorCompiled,
         configurator.ViewConfigurator,
         configurator.ViewConfiguratorLine,
         configurator.ViewConfiguratorSnapshot,
         configurator.ViewConfiguratorLineField,
         configurator.ViewConfiguratorLineButton,
         view.View,
+        ir.ModelField,
+        ir.ModelButton,
+        ir.ModelAccess,
+        ir.ModelFieldAccess,
+        ir.Translation,
+        ir.Module,
+        ir.ViewTreeOptional,
+        ir.Cron,
         module='view_configurator', type_='model')
     Pool.register_mixin(
-        configurator.ModelViewMixin, ModelView, module='view_configurator')
+        configurator.ModelViewMixin, configurator.ConfigurableModelView,
+        module='view_configurator')
@@ -1,15 +1,77 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+import fnmatch
+import hashlib
+import logging
+import time
 from collections import defaultdict
+from itertools import chain, islice
+from threading import Lock
+from weakref import WeakKeyDictionary
+from trytond import backend
 from trytond.model import (DeactivableMixin, ModelSQL, ModelView, fields,
-    sequence_ordered, UnionMixin)
+    sequence_ordered, UnionMixin, Index, Unique)
 from trytond.pool import Pool
+from trytond.cache import Cache, freeze
+from trytond.config import config
 from trytond.pyson import Bool, Eval
-from sql import Column, Literal
+from sql import Column, Literal, Null
+from sql.conditionals import Case, Coalesce
+from sql.operators import Exists
+from sql.functions import CurrentTimestamp
 from lxml import etree
 from trytond.rpc import RPC
+from trytond.tools import grouped_slice, reduce_ids
 from trytond.transaction import Transaction
 
+from .stats import statistics
+from .store import compile_timeout, compiled_views, single_flight
+
+logger = logging.getLogger(__name__)
+
+_model_resolution_caches = {}
+_model_resolution_lock = Lock()
+_transaction_resolutions = WeakKeyDictionary()
+
+
+def _model_patterns(option):
+    value = config.get('view_configurator', option, default='')
+    return value.replace(',', ' ').split()
+
+
+def is_configurable(model_name):
+    """Return whether the views of the model can be configured
+
+    The models option lists the patterns of the models allowed, all by
+    default, and the exclude_models option the patterns of the models
+    excluded. The configurator itself is never configurable.
+    """
+    if model_name == 'view.configurator':
+        return False
+    allowed = _model_patterns('models')
+    if allowed and not any(
+            fnmatch.fnmatchcase(model_name, p) for p in allowed):
+        return False
+    return not any(
+        fnmatch.fnmatchcase(model_name, p)
+        for p in _model_patterns('exclude_models'))
+
+
+class _ConfigurableModelViewMeta(type):
+
+    def __subclasscheck__(cls, subclass):
+        return (issubclass(subclass, ModelView)
+            and is_configurable(getattr(subclass, '__name__', '')))
+
+
+class ConfigurableModelView(metaclass=_ConfigurableModelViewMeta):
+    """Match the ModelView classes of the configurable models
+
+    It is used as classinfo to register the mixin only on them, so the other
+    models do not pay for the override.
+    """
+    __slots__ = ()
+
 
 class ModelViewMixin:
     __slots__ = ()
@@ -18,64 +80,215 @@ class ModelViewMixin:
     def fields_view_get(cls, view_id=None, view_type='form', level=None):
         pool = Pool()
         ViewConfigurator = pool.get('view.configurator')
-        UiView = pool.get('ir.ui.view')
 
-        user_id = Transaction().user or None
-        view_conf_id = view_id or None
-        is_view_tree = view_type == 'tree'
-
-        if view_conf_id:
-            view = UiView(view_conf_id)
-            is_view_tree = view.type == 'tree'
-
-        # One2many fields with XML view_ids attribute, call fields_view_get()
-        # without specifying a view_type (default view_type is 'form')
-        if (not is_view_tree
-                or Transaction().context.get('avoid_custom_view')
-                or cls.__name__ == 'view.configurator'):
+        # Models without any configurator must not pay for any lookup
+        if (Transaction().context.get('avoid_custom_view')
+                or not ViewConfigurator.has_configurator(cls.__name__)):
             return super().fields_view_get(view_id, view_type, level)
 
-        if not view_conf_id:
-            views = UiView.search([
-                    ('model.model', '=', cls.__name__),
-                    ('type', '=', 'tree'),
-                    ], limit=1)
-            if views:
-                view_conf_id = views[0].id
-        view_configurations = ViewConfigurator.search([
-                ('model.name', '=', cls.__name__),
-                ('view', 'in', (None, view_conf_id)),
-                ('user', 'in', (None, user_id)),
-                ], limit=1)
-        if not view_configurations:
+        view_conf_id = view_id or None
+        configurator_id = ViewConfigurator.resolve_view(
+            cls.__name__, view_conf_id, view_type, Transaction().user or None)
+        if configurator_id is None:
             return super().fields_view_get(view_id, view_type, level)
-        view_configurator, = view_configurations
+        view_configurator = ViewConfigurator(configurator_id)
+
+        with statistics.timer('get_configured_view', cls.__name__):
+            compiled = cls.get_configured_view(
+                view_configurator, view_conf_id, level)
+        if compiled is None:
+            return super().fields_view_get(view_conf_id, view_type, level)
+        result, optional_names = compiled
+        return ViewConfigurator.apply_tree_optionals(result, optional_names)
+
+    @classmethod
+    def get_configured_view(cls, view_configurator, view_id=None,
+            level=None):
+        """Return the compiled tree view of the configurator and the names of
+        its optional fields
+
+        The compiled view is shared by all the users with the same groups
+        and language, their optional columns are applied on top of it.
+        On a cold cache, it is loaded from the database when its inputs did
+        not change since it was stored.
+        """
+        pool = Pool()
+        ViewConfigurator = pool.get('view.configurator')
+        User = pool.get('res.user')
+
+        key = (cls.__name__, view_id, view_configurator.id,
+            ViewConfigurator.get_generation(
+                cls.__name__, view_configurator.id),
+            level, Transaction().language, User.get_groups())
+        # The field definitions are shared by all the views of the model
+        fields_key = (cls.__name__, level, Transaction().language,
+            User.get_groups())
+        compiled = ViewConfigurator.get_compiled(key)
+        if compiled is not None:
+            statistics.count('hit', cls.__name__)
+            return compiled
+
+        # Concurrent callers of the same key wait for the first one
+        with single_flight((Transaction().database.name, key)):
+            compiled = ViewConfigurator.get_compiled(key)
+            if compiled is not None:
+                statistics.count('coalesced', cls.__name__)
+                return compiled
+
+            fingerprint = view_configurator.get_fingerprint(key)
+            compiled = ViewConfigurator.load_compiled(fingerprint)
+            if compiled is not None:
+                statistics.count('load', cls.__name__)
+            elif ViewConfigurator.compile_locked():
+                compiled = cls._compile_locked_view(
+                    view_configurator, view_id, level, fingerprint)
+            if compiled is None:
+                statistics.count('miss', cls.__name__)
+                compiled = cls._compile_configured_view(
+                    view_configurator, view_id, level)
+                if compiled is None:
+                    return
+                view_configurator.store_compiled(fingerprint, compiled)
+            store = compiled_views(Transaction().database.name)
+            store.set(key, cls.__name__, compiled, fields_key)
+            # The stored view shares the definitions of its fields key
+            compiled = store.get(key) or compiled
+        return compiled
 
-        key = (cls.__name__, view_configurator.id)
-        cached = cls._fields_view_get_cache.get(key)
-        if cached:
-            return cached
+    @classmethod
+    def _compile_locked_view(cls, view_configurator, view_id, level,
+            fingerprint):
+        """Return the compiled view of the fingerprint or None
+
+        The processes missing the view wait for the advisory lock of the
+        first one, which compiles and stores the view in a new transaction
+        committed before the lock is released, and then load it.
+        None is returned when the lock can not be taken in time.
+        """
+        pool = Pool()
+        ViewConfigurator = pool.get('view.configurator')
+        transaction = Transaction()
+        try:
+            with transaction.new_transaction() as new_transaction:
+                ViewConfigurator.lock_compiled(fingerprint)
+                compiled = ViewConfigurator.load_compiled(fingerprint)
+                if compiled is not None:
+                    statistics.count('load', cls.__name__)
+                    return compiled
+                statistics.count('miss', cls.__name__)
+                view_configurator = ViewConfigurator(view_configurator.id)
+                compiled = cls._compile_configured_view(
+                    view_configurator, view_id, level)
+                if compiled is not None:
+                    view_configurator._insert_compiled(fingerprint, compiled)
+                    new_transaction.commit()
+                return compiled
+        except backend.DatabaseOperationalError:
+            logger.warning(
+                "timeout waiting for the compiled view %s", fingerprint)
 
-        result = super().fields_view_get(view_conf_id, view_type, level)
+    @classmethod
+    def _compile_configured_view(cls, view_configurator, view_id, level):
+        "Return the compiled tree view of the configurator or None"
+        result = super().fields_view_get(view_id, 'tree', level)
         # Convert from mappingproxy to dict to be able to modify it
         result = dict(result)
         if result.get('type') != 'tree':
-            return result
-        xml = view_configurator.generate_xml()
-        parser = etree.XMLParser(remove_blank_text=True)
-        tree = etree.fromstring(xml, parser)
+            return
+        with statistics.timer('generate_tree', cls.__name__):
+            tree = view_configurator.generate_tree(optionals={})
+        optional_names = tuple(sorted({e.get('name')
+                    for e in tree.iterfind('field[@optional]')}))
 
         if level is None:
             level = 1 if result['type'] == 'tree' else 0
-        # convert mappingproxy to dict
-        result = dict(result)
-        result['arch'], result['fields'] = cls.parse_view(tree, 'tree',
-            field_children=result['field_childs'], level=level)
-        cls._fields_view_get_cache.set(key, result)
-        return result
+        with statistics.timer('parse_view', cls.__name__):
+            result['arch'], result['fields'] = cls.parse_view(
+                tree, 'tree', field_children=result['field_childs'],
+                level=level)
+        return result, optional_names
+
+
+class CompiledViewsClearMixin:
+    "Clear the compiled configured views when records change"
+    __slots__ = ()
 
+    @classmethod
+    def _clears_compiled_views(cls, records):
+        "Return whether the change of the records clears the compiled views"
+        return bool(records)
+
+    @classmethod
+    def create(cls, vlist):
+        pool = Pool()
+        ViewConfigurator = pool.get('view.configurator')
+        records = super().create(vlist)
+        if cls._clears_compiled_views(records):
+            ViewConfigurator.clear_compiled_views()
+        return records
+
+    @classmethod
+    def write(cls, *args):
+        pool = Pool()
+        ViewConfigurator = pool.get('view.configurator')
+        actions = iter(args)
+        all_records = []
+        for records, _ in zip(actions, actions):
+            all_records.extend(records)
+        # The records may no longer match after the write
+        clear = cls._clears_compiled_views(all_records)
+        super().write(*args)
+        if clear or cls._clears_compiled_views(
+                cls.browse([r.id for r in all_records])):
+            ViewConfigurator.clear_compiled_views()
 
-class ViewConfiguratorSnapshot(ModelSQL, ModelView):
+    @classmethod
+    def delete(cls, records):
+        pool = Pool()
+        ViewConfigurator = pool.get('view.configurator')
+        clear = cls._clears_compiled_views(records)
+        super().delete(records)
+        if clear:
+            ViewConfigurator.clear_compiled_views()
+
+
+class ConfiguratorInvalidateMixin:
+    "Invalidate the compiled view of the configurator when records change"
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, vlist):
+        pool = Pool()
+        ViewConfigurator = pool.get('view.configurator')
+        records = super().create(vlist)
+        if not Transaction().context.get('view_configurator_defer'):
+            ViewConfigurator.invalidate([r.view for r in records])
+        return records
+
+    @classmethod
+    def write(cls, *args):
+        pool = Pool()
+        ViewConfigurator = pool.get('view.configurator')
+        actions = iter(args)
+        all_records = []
+        for records, _ in zip(actions, actions):
+            all_records.extend(records)
+        # The configurator of a record may be changed by the write
+        views = [r.view for r in all_records]
+        super().write(*args)
+        ViewConfigurator.invalidate(views + [r.view for r in all_records])
+
+    @classmethod
+    def delete(cls, records):
+        pool = Pool()
+        ViewConfigurator = pool.get('view.configurator')
+        views = [r.view for r in records]
+        super().delete(records)
+        ViewConfigurator.invalidate(views)
+
+
+class ViewConfiguratorSnapshot(ConfiguratorInvalidateMixin, ModelSQL,
+        ModelView):
     'View configurator Snapshot'
     __name__ = 'view.configurator.snapshot'
 
@@ -83,8 +296,50 @@ class ViewConfiguratorSnapshot(ModelSQL, ModelView):
     field = fields.Many2One('ir.model.field', 'Field')
     button = fields.Many2One('ir.model.button', 'Button')
 
+    @classmethod
+    def __setup__(cls):
+        super().__setup__()
+        t = cls.__table__()
+        cls._sql_indexes.update({
+                Index(t, (t.view, Index.Equality()),
+                    (t.field, Index.Equality())),
+                Index(t, (t.view, Index.Equality()),
+                    (t.button, Index.Equality())),
+                })
+
+    @classmethod
+    def delete(cls, snapshots):
+        pool = Pool()
+        ViewConfigurator = pool.get('view.configurator')
+        views = [s.view for s in snapshots]
+        super().delete(snapshots)
+        # The snapshot is no longer complete
+        ViewConfigurator.reset_base_fingerprint(views)
+
+
+class ViewConfiguratorCompiled(ModelSQL):
+    'View Configurator Compiled'
+    __name__ = 'view.configurator.compiled'
+
+    configurator = fields.Many2One('view.configurator', 'View Configurator',
+        required=True, ondelete='CASCADE')
+    fingerprint = fields.Char('Fingerprint', required=True)
+    data = fields.Dict(None, 'Data')
 
-class ViewConfigurator(sequence_ordered(), DeactivableMixin, ModelSQL, ModelView):
+    @classmethod
+    def __setup__(cls):
+        super().__setup__()
+        t = cls.__table__()
+        cls._sql_indexes.add(Index(t, (t.fingerprint, Index.Equality())))
+        cls._sql_constraints += [
+            ('configurator_fingerprint_unique',
+                Unique(t, t.configurator, t.fingerprint),
+                'view_configurator.msg_compiled_unique'),
+            ]
+
+
+class ViewConfigurator(sequence_ordered(), DeactivableMixin, ModelSQL,
+        ModelView):
     '''View Configurator'''
     __name__ = 'view.configurator'
 
@@ -92,32 +347,600 @@ class ViewConfigurator(sequence_ordered(), DeactivableMixin, ModelSQL, ModelView
         states={
             'readonly': Eval('lines', [0]) & Eval('model'),
             })
-    model_name = fields.Function(fields.Char('Model Name'),
-        'on_change_with_model_name')
-    user = fields.Many2One('res.user', 'User')
+    model_name = fields.Char('Model Name', readonly=True)
+    user = fields.Many2One('res.user', 'User',
+        states={
+            'invisible': Bool(Eval('group')),
+            })
+    group = fields.Many2One('res.group', 'Group',
+        states={
+            'invisible': Bool(Eval('user')),
+            },
+        help="Apply the configurator to the users of the group.")
+    parent = fields.Many2One('view.configurator', 'Parent',
+        domain=[
+            ('model', '=', Eval('model')),
+            ('view', 'in', [None, Eval('view')]),
+            ('group', '!=', None),
+            ('user', '=', None),
+            ],
+        states={
+            'invisible': ~Eval('user'),
+            },
+        help="The group configurator of which the lines are only changes.")
     view = fields.Many2One('ir.ui.view', 'View',
         domain=[
             ('type', 'in', (None, 'tree')),
             ('model', '=', Eval('model_name')),
             ('inherit', '=',  None),
         ])
-    snapshot = fields.One2Many('view.configurator.snapshot', 'view', 'Snapshot',
+    snapshot = fields.One2Many(
+        'view.configurator.snapshot', 'view', 'Snapshot',
         readonly=True)
     lines = fields.One2Many('view.configurator.line', 'view', "Lines",
         states={
-            'readonly': ~Bool(Eval('snapshot', [])),
+            'readonly': ~Bool(Eval('snapshot', [])) & ~Eval('parent'),
             })
+    effective_lines = fields.Function(fields.One2Many(
+            'view.configurator.line', None, "Effective Lines",
+            states={
+                'invisible': ~Eval('parent'),
+                },
+            help="The lines of the parent with the changes of the "
+            "configurator."),
+        'get_effective_lines')
+    generation = fields.Integer('Generation', readonly=True)
+    base_fingerprint = fields.Char('Base Fingerprint', readonly=True)
+
+    _resolution_cache = Cache('view.configurator.resolution', context=False)
+    _compiled_cache = Cache('view.configurator.compiled', context=False)
+    _base_tree_cache = Cache('view.configurator.base_tree', context=False)
+    _modules_cache = Cache('view.configurator.modules', context=False)
+    _tree_optionals_cache = Cache(
+        'view.configurator.tree_optionals', context=False)
 
     @classmethod
     def __setup__(cls):
         super().__setup__()
+        t = cls.__table__()
+        cls._sql_indexes.add(
+            Index(t,
+                (t.model_name, Index.Equality()),
+                (t.user, Index.Equality()),
+                (t.view, Index.Equality())))
         cls._buttons.update({
             'do_snapshot': {},
             })
         cls.__rpc__.update({
             'get_custom_view': RPC(readonly=False, unique=False),
+            'get_custom_views': RPC(unique=False),
+            'create_custom_views': RPC(readonly=False, unique=False),
+            'warm_up': RPC(readonly=False),
+            'get_stats': RPC(),
+            'resequence': RPC(readonly=False, instantiate=0),
             })
 
+    @classmethod
+    def __register__(cls, module_name):
+        pool = Pool()
+        Model = pool.get('ir.model')
+        table = cls.__table__()
+        model = Model.__table__()
+        cursor = Transaction().connection.cursor()
+
+        super().__register__(module_name)
+
+        # Migration: fill the stored model name
+        cursor.execute(*table.update(
+                [table.model_name],
+                [model.select(model.name, where=model.id == table.model)],
+                where=table.model_name == Null))
+
+    @classmethod
+    def _model_resolution_cache(cls, model_name):
+        # Each configured model has its own cache so its timestamp in the
+        # cache table acts as a per-model stamp: other workers check it
+        # once per transaction and only reload the models that changed.
+        cache = _model_resolution_caches.get(model_name)
+        if cache is None:
+            with _model_resolution_lock:
+                cache = _model_resolution_caches.get(model_name)
+                if cache is None:
+                    cache = Cache(
+                        'view.configurator.resolution.%s' % model_name,
+                        context=False)
+                    _model_resolution_caches[model_name] = cache
+        return cache
+
+    @classmethod
+    def _resolution_query(cls, model_name=None):
+        pool = Pool()
+        FieldLine = pool.get('view.configurator.line.field')
+        ButtonLine = pool.get('view.configurator.line.button')
+        table = cls.__table__()
+        field_line = FieldLine.__table__()
+        button_line = ButtonLine.__table__()
+
+        condition = table.active == Literal(True)
+        if model_name is not None:
+            condition &= table.model_name == model_name
+        has_lines = (
+            Exists(field_line.select(field_line.id,
+                    where=field_line.view == table.id))
+            | Exists(button_line.select(button_line.id,
+                    where=button_line.view == table.id)))
+        return table.select(
+            table.model_name, table.view, table.user, table.group,
+            table.id, table.generation, table.parent, has_lines,
+            where=condition,
+            order_by=[table.sequence.asc.nulls_first, table.id.asc])
+
+    @classmethod
+    def _query_configured_models(cls, model_names=None):
+        "Return the names of the models with an active configurator"
+        table = cls.__table__()
+        cursor = Transaction().connection.cursor()
+
+        condition = table.active == Literal(True)
+        if model_names is None:
+            cursor.execute(*table.select(
+                    table.model_name, where=condition, distinct=True))
+            return frozenset(r for r, in cursor)
+        configured = set()
+        for sub_names in grouped_slice(list(model_names)):
+            cursor.execute(*table.select(table.model_name,
+                    where=condition & table.model_name.in_(list(sub_names)),
+                    distinct=True))
+            configured.update(r for r, in cursor)
+        return frozenset(configured)
+
+    @classmethod
+    def get_configured_models(cls):
+        """Return the names of the models with an active configurator
+
+        Models not in this set have no configurator, so checking them costs
+        no query.
+        """
+        model_names = cls._resolution_cache.get('models')
+        if model_names is None:
+            statistics.count('lookup_query')
+            model_names = cls._query_configured_models()
+            cls._resolution_cache.set('models', model_names)
+        return model_names
+
+    @classmethod
+    def get_model_resolution(cls, model_name):
+        """Return the resolution of the configurators of the model
+
+        It is a tuple of a dictionary of (view id, user id, group id) ->
+        configurator id in sequence order and of a dictionary of
+        configurator id -> generation.
+        The user configurators without changes resolve to their group
+        configurator so their users share its compiled view.
+        """
+        cache = cls._model_resolution_cache(model_name)
+        resolution = cache.get('resolution')
+        if resolution is None:
+            statistics.count('lookup_query', model_name)
+            cursor = Transaction().connection.cursor()
+            cursor.execute(*cls._resolution_query(model_name))
+            entries, generations, parents = {}, {}, {}
+            for (_, view_id, user_id, group_id, id_, generation, parent_id,
+                    has_lines) in cursor:
+                if user_id is not None:
+                    group_id = None
+                # The first configurator in sequence order wins
+                entries.setdefault((view_id, user_id, group_id), id_)
+                generations[id_] = generation or 0
+                if parent_id is not None and not has_lines:
+                    parents[id_] = parent_id
+            for key, id_ in entries.items():
+                if parents.get(id_) in generations:
+                    entries[key] = parents[id_]
+            resolution = (entries, generations)
+            cache.set('resolution', resolution)
+        return resolution
+
+    @classmethod
+    def get_generation(cls, model_name, configurator_id):
+        "Return the generation of the compiled view of the configurator"
+        _, generations = cls.get_model_resolution(model_name)
+        return generations.get(configurator_id, 0)
+
+    @classmethod
+    def clear_resolution(cls, model_names, configured=None):
+        """Drop the resolution of the models in every worker
+
+        configured is the result of _query_configured_models for the models
+        before a change which may add or remove configured models, the
+        configured models are only cleared if it differs after the change.
+        """
+        model_names = set(filter(None, model_names))
+        for model_name in model_names:
+            cls._model_resolution_cache(model_name).clear()
+        if (configured is not None
+                and cls._query_configured_models(model_names) != configured):
+            cls._resolution_cache.clear()
+        _transaction_resolutions.pop(Transaction(), None)
+
+    @classmethod
+    def invalidate(cls, views):
+        """Invalidate the compiled views of the configurators
+
+        Only the cache entries of those configurators become stale, the
+        views of any other model are kept.
+        """
+        pool = Pool()
+        Compiled = pool.get('view.configurator.compiled')
+        table = cls.__table__()
+        compiled = Compiled.__table__()
+        cursor = Transaction().connection.cursor()
+        views = list(set(views))
+        ids = [v.id for v in views]
+        # The user configurators compile the lines of their group one
+        for sub_ids in grouped_slice(ids):
+            cursor.execute(*table.select(table.id,
+                    where=reduce_ids(table.parent, sub_ids)))
+            ids.extend(r for r, in cursor)
+        for sub_ids in grouped_slice(ids):
+            cursor.execute(*table.update(
+                    [table.generation],
+                    [Coalesce(table.generation, 0) + 1],
+                    where=reduce_ids(table.id, sub_ids)))
+            cursor.execute(*compiled.delete(
+                    where=reduce_ids(compiled.configurator, sub_ids)))
+        cls.clear_resolution(v.model_name for v in views)
+
+    @classmethod
+    def clear_compiled_views(cls):
+        "Clear the compiled views and base trees of all the configurators"
+        pool = Pool()
+        Compiled = pool.get('view.configurator.compiled')
+        table = Compiled.__table__()
+        cursor = Transaction().connection.cursor()
+        cursor.execute(*table.delete())
+        cls._compiled_cache.clear()
+        compiled_views(Transaction().database.name).clear()
+        cls._base_tree_cache.clear()
+        cls._modules_cache.clear()
+        _transaction_resolutions.pop(Transaction(), None)
+
+    @classmethod
+    def get_module_versions(cls):
+        "Return the names and versions of the activated modules"
+        pool = Pool()
+        Module = pool.get('ir.module')
+        versions = cls._modules_cache.get('versions')
+        if versions is None:
+            versions = tuple(sorted((m.name, m.version)
+                    for m in Module.search([('state', '=', 'activated')])))
+            cls._modules_cache.set('versions', versions)
+        return versions
+
+    def get_fingerprint(self, key):
+        """Return the fingerprint of the inputs of the compiled view
+
+        key identifies the compiled view and contains the generation of the
+        lines, the base tree and the module versions are added to it.
+        """
+        base = self.get_base_tree(
+            self.model_name, self.view.id if self.view else None)
+        inputs = (key, self.get_base_fingerprint(base),
+            self.get_module_versions())
+        return hashlib.sha256(repr(inputs).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def get_base_fingerprint(cls, base):
+        "Return the fingerprint of a result of get_base_tree"
+        columns, resources = base
+        inputs = (columns,
+            sorted(resources['field'].items()),
+            sorted(resources['button'].items()))
+        return hashlib.sha256(repr(inputs).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def reset_base_fingerprint(cls, views):
+        "Force the next snapshot of the configurators"
+        table = cls.__table__()
+        cursor = Transaction().connection.cursor()
+        for sub_ids in grouped_slice(list({v.id for v in views})):
+            cursor.execute(*table.update(
+                    [table.base_fingerprint], [Null],
+                    where=reduce_ids(table.id, sub_ids)))
+
+    @classmethod
+    def get_compiled(cls, key):
+        "Return the compiled view of key from the store of the worker or None"
+        store = compiled_views(Transaction().database.name)
+        # The cache only holds an epoch, it is cleared in every worker when
+        # the compiled views of the database must be dropped
+        if cls._compiled_cache.get('epoch') is None:
+            store.clear()
+            cls._compiled_cache.set('epoch', True)
+        return store.get(key)
+
+    @classmethod
+    def load_compiled(cls, fingerprint):
+        "Return the stored compiled view with the fingerprint or None"
+        pool = Pool()
+        Compiled = pool.get('view.configurator.compiled')
+        records = Compiled.search([
+                ('fingerprint', '=', fingerprint),
+                ], limit=1)
+        if records:
+            record, = records
+            return (record.data['result'],
+                tuple(record.data['optional_names']))
+
+    def store_compiled(self, fingerprint, compiled):
+        """Store the compiled view under the fingerprint
+
+        It is only stored by writable transactions.
+        """
+        if not Transaction().readonly:
+            self._insert_compiled(fingerprint, compiled)
+
+    def _insert_compiled(self, fingerprint, compiled):
+        "Insert the compiled view unless it is already stored"
+        pool = Pool()
+        Compiled = pool.get('view.configurator.compiled')
+        transaction = Transaction()
+        table = Compiled.__table__()
+        cursor = transaction.connection.cursor()
+        result, optional_names = compiled
+        data = Compiled.data.sql_format({
+                'result': result,
+                'optional_names': list(optional_names),
+                })
+        # Concurrent compilations store the same view, the savepoint keeps
+        # the transaction usable when the unique constraint rejects it
+        cursor.execute('SAVEPOINT view_configurator_compiled')
+        try:
+            cursor.execute(*table.insert(
+                    [table.configurator, table.fingerprint, table.data,
+                        table.create_uid, table.create_date],
+                    [[self.id, fingerprint, data,
+                            transaction.user, CurrentTimestamp()]]))
+        except backend.DatabaseIntegrityError:
+            cursor.execute(
+                'ROLLBACK TO SAVEPOINT view_configurator_compiled')
+        else:
+            cursor.execute('RELEASE SAVEPOINT view_configurator_compiled')
+
+    @classmethod
+    def compile_locked(cls):
+        """Return whether the processes coordinate the compilation of the
+        views through an advisory lock
+
+        It requires the compile_lock option on PostgreSQL and a read-only
+        transaction, as the view is compiled in a new transaction which does
+        not see the changes of the current one.
+        """
+        return (config.getboolean(
+                'view_configurator', 'compile_lock', default=False)
+            and backend.name == 'postgresql'
+            and Transaction().readonly)
+
+    @classmethod
+    def lock_compiled(cls, fingerprint):
+        """Wait up to compile_timeout seconds for the advisory lock of the
+        fingerprint until the end of the transaction"""
+        cursor = Transaction().connection.cursor()
+        cursor.execute('SET LOCAL lock_timeout = %s',
+            ('%dms' % (compile_timeout() * 1000),))
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)',
+            (int(fingerprint[:15], 16),))
+
+    @classmethod
+    def has_configurator(cls, model_name):
+        return model_name in cls.get_configured_models()
+
+    @classmethod
+    def resolve_view(cls, model_name, view_id, view_type, user_id=None):
+        """Return the id of the configurator to apply to the view or None
+
+        The result is memoized for the transaction, so the tree views of
+        all the One2Many fields of a form cost at most one lookup per model.
+        """
+        pool = Pool()
+        UiView = pool.get('ir.ui.view')
+
+        memo = _transaction_resolutions.setdefault(Transaction(), {})
+        key = (model_name, view_id, view_type, user_id)
+        if key in memo:
+            return memo[key]
+        configurator_id = None
+        is_view_tree = view_type == 'tree'
+        if view_id:
+            is_view_tree = UiView(view_id).type == 'tree'
+        # One2many fields with XML view_ids attribute, call fields_view_get()
+        # without specifying a view_type (default view_type is 'form')
+        if is_view_tree:
+            configurator_id = cls.resolve_configurator(
+                model_name, view_id, user_id)
+        memo[key] = configurator_id
+        return configurator_id
+
+    @classmethod
+    def resolve_configurator(cls, model_name, view_id=None, user_id=None):
+        """Return the id of the configurator to apply or None
+
+        Precedence is: user and view, user, group and view, group, view and
+        finally global.
+        """
+        pool = Pool()
+        UiView = pool.get('ir.ui.view')
+
+        if not cls.has_configurator(model_name):
+            return None
+        entries, _ = cls.get_model_resolution(model_name)
+        if not view_id and any(v is not None for v, _, _ in entries):
+            statistics.count('lookup_query', model_name)
+            views = UiView.search([
+                    ('model.model', '=', model_name),
+                    ('type', '=', 'tree'),
+                    ], limit=1)
+            if views:
+                view_id = views[0].id
+        for key in [(view_id, user_id, None), (None, user_id, None)]:
+            if key in entries:
+                return entries[key]
+        group_id = cls._resolve_group(entries, view_id, user_id)
+        if group_id is not None:
+            return group_id
+        for key in [(view_id, None, None), (None, None, None)]:
+            if key in entries:
+                return entries[key]
+
+    @classmethod
+    def _resolve_group(cls, entries, view_id, user_id):
+        """Return the id of the group configurator of the user from the
+        resolution entries or None"""
+        pool = Pool()
+        User = pool.get('res.user')
+
+        if (user_id is None
+                or not any(g is not None for _, _, g in entries)):
+            return None
+        with Transaction().set_user(user_id):
+            groups = set(User.get_groups())
+        for view in [view_id, None]:
+            for (v, u, g), id_ in entries.items():
+                if g in groups and u is None and v == view:
+                    return id_
+
+    @classmethod
+    def get_stats(cls):
+        """Return the counters and timers of the current worker
+
+        The counters are the compiled view cache hits, loads from the
+        database and misses, and the lookup queries, per model.
+        The timers are in seconds.
+        The store holds the size in bytes, the count, the evictions and the
+        rejections of the compiled views of the database kept by the worker.
+        """
+        stats = statistics.get()
+        stats['store'] = compiled_views(
+            Transaction().database.name).get_stats()
+        return stats
+
+    @classmethod
+    def warm_up(cls, views=None):
+        """Compile and cache the views of the configurators
+
+        All the active configurators are compiled when views is None.
+        Each view is compiled as its user, as a member of its group or as
+        the current user for the global configurators, because the groups
+        of the user are part of the cache key.
+        The user configurators without lines are skipped as they resolve to
+        their parent.
+        Return the number of compiled views and the duration in seconds of
+        each compilation as a list of (configurator id, duration).
+        It requires the access to the compiled views as it compiles them as
+        other users.
+        """
+        pool = Pool()
+        ModelAccess = pool.get('ir.model.access')
+        User = pool.get('res.user')
+        transaction = Transaction()
+
+        ModelAccess.check('view.configurator.compiled', 'write')
+
+        if views is None:
+            views = cls.search([])
+        else:
+            views = cls.search([('id', 'in', [int(v) for v in views])])
+        durations = []
+        members = {}
+        for view in views:
+            Model = pool.get(view.model.name)
+            if not issubclass(Model, ModelViewMixin):
+                continue
+            if view.parent and not view.lines:
+                continue
+            user = view.user
+            if not user and view.group:
+                if view.group.id not in members:
+                    users = User.search([
+                            ('groups', '=', view.group.id),
+                            ], limit=1)
+                    members[view.group.id] = users[0] if users else None
+                user = members[view.group.id]
+                if not user:
+                    continue
+            user_id, context = transaction.user, {}
+            if user:
+                user_id = user.id
+                if user.language:
+                    context['language'] = user.language.code
+            start = time.perf_counter()
+            with transaction.set_user(user_id), \
+                    transaction.set_context(context):
+                Model.get_configured_view(
+                    view, view.view.id if view.view else None)
+            duration = time.perf_counter() - start
+            logger.info("compiled view configurator %s for %s in %.3fs",
+                view.id, view.model.name, duration)
+            durations.append((view.id, duration))
+        return {
+            'compiled': len(durations),
+            'durations': durations,
+            }
+
+    @classmethod
+    def _queue_warm_up(cls, views):
+        "Queue the warm up of the views saved by the user"
+        with Transaction().set_context(_check_access=False):
+            cls.__queue__.warm_up(views)
+
+    @classmethod
+    def get_tree_optionals(cls, view_id, user=None):
+        """Return the optional columns of the view for the user
+
+        All the preferences of the user are loaded at once and kept until
+        ir.ui.view_tree_optional is modified.
+        """
+        pool = Pool()
+        ViewTreeOptional = pool.get('ir.ui.view_tree_optional')
+
+        if user is None:
+            user = Transaction().user
+        optionals = cls._tree_optionals_cache.get(user)
+        if optionals is None:
+            statistics.count('tree_optionals')
+            optionals = defaultdict(dict)
+            for record in ViewTreeOptional.search_read([
+                        ('user', '=', user),
+                        ], fields_names=['view', 'field', 'value']):
+                optionals[record['view']][record['field']] = record['value']
+            optionals = dict(optionals)
+            cls._tree_optionals_cache.set(user, optionals)
+        return optionals.get(view_id, {})
+
+    @classmethod
+    def apply_tree_optionals(cls, result, names):
+        """Return the compiled tree view with the optional columns of the
+        current user
+
+        The compiled result is returned untouched when the user has no
+        preference for any of the optional field names.
+        """
+        if not names or not result.get('view_id'):
+            return result
+        view_optionals = cls.get_tree_optionals(result['view_id'])
+        optionals = {n: str(int(view_optionals[n]))
+            for n in names if n in view_optionals}
+        if not optionals:
+            return result
+        tree = etree.fromstring(result['arch'])
+        for element in tree.iterfind('field[@optional]'):
+            value = optionals.get(element.get('name'))
+            if value is not None:
+                element.set('optional', value)
+        result = dict(result)
+        result['arch'] = etree.tostring(tree, encoding='unicode')
+        return result
+
     @classmethod
     def delete(cls, views):
         pool = Pool()
@@ -125,12 +948,86 @@ class ViewConfigurator(sequence_ordered(), DeactivableMixin, ModelSQL, ModelView
         Lines = pool.get('view.configurator.line')
         snapshots = []
         lines = []
+        ids = {v.id for v in views}
+        with Transaction().set_context(active_test=False):
+            children = cls.search([
+                    ('parent', 'in', list(ids)),
+                    ('id', 'not in', list(ids)),
+                    ])
+        cls.detach(children)
         for view in views:
             snapshots += [x for x in view.snapshot]
             lines += [x for x in view.lines]
+        model_names = {v.model_name for v in views}
+        configured = cls._query_configured_models(model_names)
         Lines.delete(lines)
         Snapshot.delete(snapshots)
         super().delete(views)
+        cls.clear_resolution(model_names, configured=configured)
+
+    @classmethod
+    def detach(cls, views):
+        """Copy into the configurators the lines they get from their parent
+        and its snapshot so they keep their layout without it"""
+        pool = Pool()
+        Line = pool.get('view.configurator.line')
+        FieldLine = pool.get('view.configurator.line.field')
+        ButtonLine = pool.get('view.configurator.line.button')
+        Snapshot = pool.get('view.configurator.snapshot')
+
+        views = [v for v in views if v.parent]
+        if not views:
+            return
+        field_lines, button_lines, snapshots = [], [], []
+        for view in views:
+            lines = view._get_tree_lines()
+            for sequence, line in enumerate(lines, 1):
+                values = {
+                    'view': view.id,
+                    'sequence': sequence,
+                    'expand': line['expand'],
+                    'optional': line['optional'],
+                    'searchable': line['searchable'],
+                    }
+                if line['field']:
+                    values['field'] = line['field']
+                    values['sum_'] = line['sum_']
+                    field_lines.append(values)
+                else:
+                    values['button'] = line['button']
+                    button_lines.append(values)
+            # The removed columns stay in the snapshot so they are not added
+            # back as new ones
+            resources = {
+                (s.field.id if s.field else None,
+                    s.button.id if s.button else None)
+                for s in view.parent.snapshot}
+            resources.update(
+                (l['field'], l['button']) for l in lines if not l['id'])
+            resources.update(
+                (l.field.id if l.field else None,
+                    l.button.id if l.button else None)
+                for l in view.lines if l.removed)
+            if view.view != view.parent.view:
+                # The parent without view follows another base tree view,
+                # the columns of the own base view are not new either
+                columns, base = cls.get_base_tree(
+                    view.model.name, view.view.id if view.view else None)
+                for type_, name, *_ in columns:
+                    resource_id = base[type_].get(name)
+                    if resource_id is None:
+                        continue
+                    resources.add((resource_id, None) if type_ == 'field'
+                        else (None, resource_id))
+            snapshots.extend({'view': view.id, 'field': f, 'button': b}
+                for f, b in resources)
+        Line.delete(Line.search([
+                    ('view', 'in', [v.id for v in views]),
+                    ]))
+        FieldLine.create(field_lines)
+        ButtonLine.create(button_lines)
+        Snapshot.create(snapshots)
+        cls.write(views, {'parent': None})
 
     @classmethod
     def copy(cls, lines, default=None):
@@ -139,222 +1036,802 @@ class ViewConfigurator(sequence_ordered(), DeactivableMixin, ModelSQL, ModelView
         else:
             default = default.copy()
         default.setdefault('snapshot', None)
+        default.setdefault('generation', 0)
+        default.setdefault('base_fingerprint', None)
         return super().copy(lines, default=default)
 
+    @staticmethod
+    def _custom_view_id(view_id):
+        if view_id in (None, 'null'):
+            return None
+        return int(view_id) or None
+
+    @classmethod
+    def _get_user_configurators(cls, model_names):
+        "Return the configurator ids of the user per (model name, view id)"
+        user = Transaction().user
+        configurators = cls.search([
+                ('model_name', 'in', list(model_names)),
+                ('user', '=', user),
+                ])
+        ids = {}
+        for configurator in configurators:
+            model_name = configurator.model_name
+            view_id = configurator.view.id if configurator.view else None
+            ids.setdefault((model_name, view_id), configurator.id)
+            # Without view, any configurator of the model matches
+            ids.setdefault((model_name, None), configurator.id)
+        return ids
+
     @classmethod
     def get_custom_view(cls, model_name, view_id):
+        id_, = cls.create_custom_views([(model_name, view_id)])
+        return id_
+
+    @classmethod
+    def get_custom_views(cls, views):
+        """Return for each (model name, view id) of views the configurator
+        id of the user and the tree view
+
+        The configurator id is None when the user has none yet, then
+        create_custom_views must be called for it. Nothing is written so it
+        runs in a read-only transaction.
+        """
         pool = Pool()
-        Model = pool.get('ir.model')
-        View = pool.get('ir.ui.view')
+        views = [(m, cls._custom_view_id(v)) for m, v in views]
+        ids = cls._get_user_configurators({m for m, _ in views})
+        result = []
+        for model_name, view_id in views:
+            Model = pool.get(model_name)
+            result.append({
+                    'id': ids.get((model_name, view_id)),
+                    'view': dict(Model.fields_view_get(view_id, 'tree')),
+                    })
+        return result
 
-        if view_id == 'null':
-            view_id = None
+    @classmethod
+    def create_custom_views(cls, views):
+        """Return the configurator id of the user for each (model name, view
+        id) of views
 
-        if view_id and view_id != None:
-            view_id = int(view_id)
+        The missing configurators are created at once.
+        """
+        pool = Pool()
+        Model = pool.get('ir.model')
 
         user = Transaction().user
-        domain = [('model.name','=', model_name), ('user', '=', user)]
-        if view_id:
-            domain += [('view', '=', view_id)]
+        views = [(m, cls._custom_view_id(v)) for m, v in views]
+        ids = cls._get_user_configurators({m for m, _ in views})
+        missing = list(dict.fromkeys(k for k in views if k not in ids))
+        if missing:
+            models = {m.name: m.id for m in Model.search([
+                        ('name', 'in', list({m for m, _ in missing})),
+                        ])}
+            vlist = []
+            for model_name, view_id in missing:
+                values = {
+                    'model': models[model_name],
+                    'view': view_id,
+                    'user': user,
+                    }
+                # Only the changes to the group layout are stored
+                if cls.has_configurator(model_name):
+                    entries, _ = cls.get_model_resolution(model_name)
+                    values['parent'] = cls._resolve_group(
+                        entries, view_id, user)
+                vlist.append(values)
+            configurators = cls.create(vlist)
+            ids.update(zip(missing, (c.id for c in configurators)))
+        return [ids[k] for k in views]
 
-        custom_views = cls.search(domain, limit=1)
-        if custom_views:
-            custom_view, = custom_views
-            return custom_view.id
-
-        model, = Model.search([('name', '=', model_name)])
-        custom_view = cls()
-        custom_view.model = model
-        if view_id:
-            custom_view.view = View(view_id)
-        custom_view.user = user
-        custom_view.save()
-        return custom_view.id
+    @staticmethod
+    def default_generation():
+        return 0
 
     @fields.depends('model')
     def on_change_with_model_name(self, name=None):
         return self.model and self.model.name or None
 
+    @classmethod
+    def _set_model_name(cls, vlist):
+        "Return vlist with the model name set from the model"
+        pool = Pool()
+        Model = pool.get('ir.model')
+        model_ids = {v['model'] for v in vlist if v.get('model')}
+        names = {m.id: m.name for m in Model.browse(list(model_ids))}
+        vlist = [v.copy() for v in vlist]
+        for values in vlist:
+            if 'model' in values:
+                values['model_name'] = names.get(values['model'])
+        return vlist
+
     @classmethod
     def create(cls, vlist):
+        vlist = cls._set_model_name(vlist)
+        # The import snapshots and clears the caches once at the end
+        if Transaction().context.get('view_configurator_defer'):
+            return super().create(vlist)
+        model_names = {v.get('model_name') for v in vlist} - {None}
+        configured = cls._query_configured_models(model_names)
         views = super().create(vlist)
-        for view in views:
-            view.create_snapshot()
-        ModelView._fields_view_get_cache.clear()
+        cls.create_snapshots(views)
+        cls.clear_resolution(model_names, configured=configured)
+        cls._queue_warm_up(views)
         return views
 
     @classmethod
-    def write(cls, views, values, *args):
-        super().write(views, values, *args)
-        ModelView._fields_view_get_cache.clear()
-
-    def generate_xml(self):
+    def write(cls, *args):
+        actions = iter(args)
+        args = []
+        all_views = []
+        membership = False
+        # The model of a configurator may be changed by the write
+        model_names = set()
+        for views, values in zip(actions, actions):
+            all_views.extend(views)
+            membership |= bool({'model', 'active'} & values.keys())
+            values, = cls._set_model_name([values])
+            args.extend((views, values))
+            model_names.update(v.model_name for v in views)
+            model_names.add(values.get('model_name'))
+        model_names.discard(None)
+        configured = None
+        if membership:
+            configured = cls._query_configured_models(model_names)
+        super().write(*args)
+        cls.invalidate(cls.browse([v.id for v in all_views]))
+        cls.clear_resolution(model_names, configured=configured)
+        cls._queue_warm_up(all_views)
+
+    def generate_xml(self, optionals=None):
+        """Return the tree arch of the configurator
+
+        optionals maps field names to the value of the optional columns,
+        by default the ones of the current user are used.
+        """
+        return '<?xml version="1.0"?>\n' + etree.tostring(
+            self.generate_tree(optionals), encoding='unicode')
+
+    def _get_tree_lines(self):
+        """Return the values of the lines to compile, including new ones
+
+        The lines of a user configurator with a parent override in place the
+        lines of the parent for the same field or button, the others are
+        added after them. The removed lines are not returned.
+        """
         pool = Pool()
+        Line = pool.get('view.configurator.line')
+
+        lines = Line.search_read([
+                ('view', '=', self.id),
+                ], fields_names=['field', 'button', 'optional', 'searchable',
+                'expand', 'sum_', 'sequence', 'removed'])
+        if self.parent:
+            overrides = {(l['field'], l['button']): l for l in lines}
+            result = []
+            for line in self.parent._get_tree_lines():
+                line = overrides.pop((line['field'], line['button']), line)
+                if not line['removed']:
+                    result.append(line)
+            result.extend(l for l in lines
+                if (l['field'], l['button']) in overrides
+                and not l['removed'])
+            return result
 
-        xml = '<?xml version="1.0"?>\n'
-        xml += '<tree>\n'
-        new_lines, _ = self.get_difference()
+        lines = [l for l in lines if not l['removed']]
+        with statistics.timer('get_difference', self.model_name):
+            new_lines, _ = self.get_difference()
+        for line in new_lines:
+            field = getattr(line, 'field', None)
+            button = getattr(line, 'button', None)
+            lines.append({
+                    'id': None,
+                    'field': field.id if field else None,
+                    'button': button.id if button else None,
+                    'optional': line.optional,
+                    'searchable': line.searchable,
+                    'expand': line.expand,
+                    'sum_': getattr(line, 'sum_', None),
+                    'sequence': line.sequence,
+                    'removed': False,
+                    })
+        return lines
+
+    def get_effective_lines(self, name):
+        """Return the ids of the stored lines compiled for the configurator
+        with a parent"""
+        if not self.parent:
+            return []
+        return [l['id'] for l in self._get_tree_lines() if l['id']]
+
+    def generate_tree(self, optionals=None):
+        """Return the tree arch of the configurator as an element
+
+        The metadata of all the fields and buttons is read at once.
+        optionals maps field names to the value of the optional columns,
+        by default the ones of the current user are used.
+        """
+        pool = Pool()
+        ModelField = pool.get('ir.model.field')
+        Button = pool.get('ir.model.button')
 
-        if self.view:
-            ViewTreeOptional = pool.get('ir.ui.view_tree_optional')
-            viewtreeoptionals = ViewTreeOptional.search([
-                    ('view', '=', self.view),
-                    ('user', '=', Transaction().user),
-                    ])
-            optionals = {o.field: o.value for o in viewtreeoptionals}
-        else:
+        if optionals is None:
             optionals = {}
-
-        for line in self.lines + tuple(new_lines):
-            if getattr(line, 'field', None):
-                if line.field.name in ('create_uid', 'create_date',
+            if self.view:
+                optionals = self.get_tree_optionals(self.view.id)
+
+        lines = self._get_tree_lines()
+        fields = {f['id']: f for f in ModelField.read(
+                list({l['field'] for l in lines if l['field']}),
+                ['name', 'ttype'])}
+        buttons = {b['id']: b for b in Button.read(
+                list({l['button'] for l in lines if l['button']}),
+                ['name'])}
+
+        tree = etree.Element('tree')
+        for line in lines:
+            if line['field']:
+                field = fields[line['field']]
+                if field['name'] in ('create_uid', 'create_date',
                         'write_uid', 'write_date'):
                     continue
 
-                name = 'name="%s"' % line.field.name
-
-                optional = ''
-                if line.optional:
-                    if line.field.name in optionals:
-                        op = str(int(optionals[line.field.name]))
-                    elif line.optional == 'show':
-                        op = '0'
-                    elif line.optional == 'hide':
-                        op = '1'
-                    optional = f'optional="{op}"'
-
-                invisible = ''
-                if line.searchable:
-                    invisible = 'tree_invisible="1"'
-
-                expand = ''
-                if line.expand:
-                    expand = 'expand="%s"' % line.expand
-
-                sum_ = ''
-                if (getattr(line, 'sum_', None) and line.field.ttype in (
-                        'integer', 'float', 'numeric', 'timedelta')):
-                    sum_ = 'sum="1"'
-
-                attributes = ' '.join([name, optional, invisible, expand, sum_])
-
-                if line.field.ttype == 'datetime':
-                    xml+= "<field %s widget='date'/>\n" % attributes
-                    xml+= "<field %s widget='time'/>\n" % attributes
+                attributes = {'name': field['name']}
+                if line['optional']:
+                    if field['name'] in optionals:
+                        attributes['optional'] = str(
+                            int(optionals[field['name']]))
+                    elif line['optional'] == 'show':
+                        attributes['optional'] = '0'
+                    elif line['optional'] == 'hide':
+                        attributes['optional'] = '1'
+                if line['searchable']:
+                    attributes['tree_invisible'] = '1'
+                if line['expand']:
+                    attributes['expand'] = str(line['expand'])
+                if line['sum_'] and field['ttype'] in (
+                        'integer', 'float', 'numeric', 'timedelta'):
+                    attributes['sum'] = '1'
+
+                if field['ttype'] == 'datetime':
+                    etree.SubElement(tree, 'field', attributes, widget='date')
+                    etree.SubElement(tree, 'field', attributes, widget='time')
                 else:
-                    xml+= "<field %s/>\n" % attributes
-            elif getattr(line, 'button', None):
-                name = 'name="%s"' % line.button.name
+                    etree.SubElement(tree, 'field', attributes)
+            elif line['button']:
+                attributes = {'name': buttons[line['button']]['name']}
+                if line['searchable']:
+                    attributes['tree_invisible'] = '1'
+                etree.SubElement(tree, 'button', attributes)
+        return tree
 
-                invisible = ''
-                if line.searchable:
-                    invisible = 'tree_invisible="1"'
-
-                attributes = ' '.join([name, invisible])
-                xml += "<button %s/>\n" % attributes
-        xml += '</tree>'
-        return xml
-
-    def get_difference(self):
+    @classmethod
+    def get_base_tree(cls, model_name, view_id=None):
+        """Return the columns of the base tree view and the model resources
+
+        The columns are a tuple of (type, name, expand, optional, invisible)
+        and the resources map each type to a dictionary of name -> id of
+        ir.model.field or ir.model.button.
+        The result is memoized per model, view and groups.
+        """
         pool = Pool()
-        Model = pool.get(self.model.name)
-        Snapshot = pool.get('view.configurator.snapshot')
-        FieldLine = pool.get('view.configurator.line.field')
-        ButtonLine = pool.get('view.configurator.line.button')
+        Model = pool.get(model_name)
+        IrModel = pool.get('ir.model')
         Button = pool.get('ir.model.button')
+        User = pool.get('res.user')
+
+        key = (model_name, view_id, User.get_groups())
+        base = cls._base_tree_cache.get(key)
+        if base is not None:
+            return base
+
         with Transaction().set_context(avoid_custom_view=True):
-            result = Model.fields_view_get(self.view, view_type='tree')
+            result = Model.fields_view_get(view_id, view_type='tree')
         parser = etree.XMLParser(remove_comments=True)
         tree = etree.fromstring(result['arch'], parser=parser)
 
-        resources = {}
-        existing_snapshot = []
-        for field in self.model.fields:
-            resources[field.name] = field
-        for line in self.snapshot:
-            if line.field:
-                existing_snapshot.append(line.field)
-            elif line.button:
-                existing_snapshot.append(line.button)
-
-        sbuttons = Button.search([
-            ('model', '=', self.model.name),
-            ])
-        for button in sbuttons:
-            resources[button.name] = button
-
-        def create_lines(type_, resource, expand, optional, invisible):
-            if type_ == 'field':
-                line = FieldLine()
-                line.type = 'ir.model.field'
-                line.field = resource
-                line.view = self
-                line.sequence = 100
-            elif type_ == 'button':
-                line = ButtonLine()
-                line.type = 'ir.model.button'
-                line.button = resource
-                line.view = self
-                line.sequence = 900
-            line.searchable = invisible
-            line.expand = expand
-            line.optional = optional
-            return line
-
-        def create_snapshot(type_, resource):
-            snapshot = Snapshot()
-            snapshot.view = self
-            if type_ == 'field':
-                snapshot.field = resource
-            else:
-                snapshot.button = resource
-            existing_snapshot.append(resource)
-            return snapshot
-
-        lines = []
-        snapshots = []
+        columns = []
         for child in tree:
             type_ = child.tag
             if type_ not in ('field', 'button'):
                 continue
             attributes = child.attrib
-            name = attributes['name']
-            expand = attributes.get('expand', None)
             if attributes.get('optional', None) == '0':
                 optional = 'hide'
             elif attributes.get('optional', None) == '1':
                 optional = 'show'
             else:
                 optional = None
-            invisible = attributes.get('tree_invisible', False)
-            if resources.get(name) and resources.get(name) not in existing_snapshot:
-                line = create_lines(type_, resources[name], expand, optional,
-                    invisible)
-                snap = create_snapshot(type_, resources[name])
-                lines.append(line)
-                snapshots.append(snap)
+            columns.append((type_, attributes['name'],
+                    attributes.get('expand', None), optional,
+                    attributes.get('tree_invisible', False)))
+
+        model, = IrModel.search([('name', '=', model_name)])
+        resources = {
+            'field': {f.name: f.id for f in model.fields},
+            'button': {b.name: b.id
+                for b in Button.search([('model', '=', model_name)])},
+            }
+        base = (tuple(columns), resources)
+        cls._base_tree_cache.set(key, base)
+        return base
+
+    def get_difference(self, base=None):
+        """Return the lines and snapshots missing from the configurator
+
+        base is the result of get_base_tree for the model and view of the
+        configurator, it is computed when not given.
+        """
+        pool = Pool()
+        Snapshot = pool.get('view.configurator.snapshot')
+        FieldLine = pool.get('view.configurator.line.field')
+        ButtonLine = pool.get('view.configurator.line.button')
+
+        if base is None:
+            base = self.get_base_tree(
+                self.model.name, self.view.id if self.view else None)
+        columns, resources = base
+
+        existing = {
+            'field': {s.field.id for s in self.snapshot if s.field},
+            'button': {s.button.id for s in self.snapshot if s.button},
+            }
+
+        lines = []
+        snapshots = []
+        for type_, name, expand, optional, invisible in columns:
+            resource_id = resources[type_].get(name)
+            if resource_id is None or resource_id in existing[type_]:
+                continue
+            existing[type_].add(resource_id)
+            snapshot = Snapshot()
+            snapshot.view = self
+            if type_ == 'field':
+                line = FieldLine()
+                line.type = 'ir.model.field'
+                line.field = resource_id
+                line.sequence = 100
+                snapshot.field = resource_id
+            else:
+                line = ButtonLine()
+                line.type = 'ir.model.button'
+                line.button = resource_id
+                line.sequence = 900
+                snapshot.button = resource_id
+            line.view = self
+            line.searchable = invisible
+            line.expand = expand
+            line.optional = optional
+            lines.append(line)
+            snapshots.append(snapshot)
         return lines, snapshots
 
     def create_snapshot(self):
+        self.create_snapshots([self])
+
+    @classmethod
+    def create_snapshots(cls, views, lines=True):
+        """Snapshot the base tree view into the configurators
+
+        The configurators are grouped by model and view so the base tree is
+        computed once per group, and all the lines and snapshots are saved
+        with one create per table.
+        The configurators already snapshotted from the same base tree are
+        skipped.
+        When lines is False, only the snapshot is stored.
+        """
         pool = Pool()
         Snapshot = pool.get('view.configurator.snapshot')
         FieldLine = pool.get('view.configurator.line.field')
         ButtonLine = pool.get('view.configurator.line.button')
+        table = cls.__table__()
+        cursor = Transaction().connection.cursor()
 
-        (lines, snapshots) = self.get_difference()
-        FieldLine.save([x for x in lines if x.type == 'ir.model.field'])
-        ButtonLine.save([x for x in lines if x.type == 'ir.model.button'])
+        groups = defaultdict(list)
+        for view in views:
+            # The snapshot of a user configurator is the one of its parent
+            if view.parent:
+                continue
+            groups[(view.model_name, view.view.id if view.view else None)
+                ].append(view)
+
+        new_lines, snapshots = [], []
+        fingerprints = defaultdict(list)
+        for (model_name, view_id), group in groups.items():
+            base = cls.get_base_tree(model_name, view_id)
+            fingerprint = cls.get_base_fingerprint(base)
+            for view in group:
+                if view.base_fingerprint == fingerprint:
+                    continue
+                with statistics.timer('get_difference', model_name):
+                    view_lines, view_snapshots = view.get_difference(base)
+                if lines:
+                    new_lines.extend(view_lines)
+                snapshots.extend(view_snapshots)
+                fingerprints[fingerprint].append(view.id)
+        FieldLine.save([x for x in new_lines if x.type == 'ir.model.field'])
+        ButtonLine.save(
+            [x for x in new_lines if x.type == 'ir.model.button'])
         Snapshot.save(snapshots)
+        for fingerprint, ids in fingerprints.items():
+            for sub_ids in grouped_slice(ids):
+                cursor.execute(*table.update(
+                        [table.base_fingerprint], [fingerprint],
+                        where=reduce_ids(table.id, sub_ids)))
+
+    @classmethod
+    def queue_snapshot_refresh(cls, model_names):
+        """Queue the snapshot of the configurators of the models
+
+        The configurators are processed in chunks of the snapshot_chunk
+        option, each one in its own task so no long transaction is held.
+        """
+        model_names = set(filter(None, model_names))
+        if not model_names:
+            return
+        views = cls.search([('model_name', 'in', list(model_names))])
+        size = config.getint('view_configurator', 'snapshot_chunk',
+            default=100)
+        chunks = [views[i:i + size] for i in range(0, len(views), size)]
+        with Transaction().set_context(queue_name='view_configurator'):
+            for index, chunk in enumerate(chunks, 1):
+                cls.__queue__.refresh_snapshots(chunk, index, len(chunks))
+
+    @classmethod
+    def refresh_snapshots(cls, views, index=None, total=None):
+        "Snapshot the configurators that still exist"
+        views = cls.search([('id', 'in', [v.id for v in views])])
+        start = time.perf_counter()
+        cls.create_snapshots(views)
+        logger.info("refreshed snapshot of %s view configurators "
+            "(chunk %s/%s) in %.3fs",
+            len(views), index, total, time.perf_counter() - start)
+
+    @classmethod
+    def export_configurators(cls, views=None):
+        """Yield the configurators as dictionaries
+
+        The models, fields and buttons are referenced by name, the views by
+        XML id, the groups by XML id or by name when they have none and the
+        users by login, so they can be imported into another database with
+        import_configurators. The parent is referenced by its group and the
+        group configurators are yielded first.
+        The configurators are read by chunks to bound the memory.
+        """
+        pool = Pool()
+        Line = pool.get('view.configurator.line')
+        Snapshot = pool.get('view.configurator.snapshot')
+
+        if views is None:
+            views = cls.search([])
+        else:
+            views = cls.browse([int(v) for v in views])
+        ids = [v.id for v in sorted(views, key=lambda v: bool(v.parent))]
+        for sub_ids in grouped_slice(ids):
+            sub_ids = list(sub_ids)
+            sub_views = cls.browse(sub_ids)
+            xml_ids = cls._get_xml_ids('ir.ui.view',
+                {v.view.id for v in sub_views if v.view})
+            groups = {v.group for v in sub_views if v.group}
+            groups |= {v.parent.group for v in sub_views if v.parent}
+            group_xml_ids = cls._get_xml_ids('res.group',
+                {g.id for g in groups})
+            group_refs = {g.id: group_xml_ids.get(g.id, g.name)
+                for g in groups}
+            lines = defaultdict(list)
+            for line in Line.search([
+                        ('view', 'in', sub_ids),
+                        ], order=[('sequence', 'ASC'), ('id', 'ASC')]):
+                resource = line.field or line.button
+                lines[line.view.id].append({
+                        'type': line.type,
+                        'name': resource.name,
+                        'sequence': line.sequence,
+                        'expand': line.expand,
+                        'optional': line.optional,
+                        'searchable': line.searchable,
+                        'removed': line.removed,
+                        'sum_': line.sum_,
+                        })
+            snapshots = defaultdict(list)
+            for snapshot in Snapshot.search([('view', 'in', sub_ids)]):
+                if snapshot.field:
+                    item = {'type': 'ir.model.field',
+                        'name': snapshot.field.name}
+                else:
+                    item = {'type': 'ir.model.button',
+                        'name': snapshot.button.name}
+                snapshots[snapshot.view.id].append(item)
+            for view in sub_views:
+                if view.view and view.view.id not in xml_ids:
+                    logger.warning("skip view configurator %s: "
+                        "view %s has no XML id", view.id, view.view.id)
+                    continue
+                yield {
+                    'model': view.model_name,
+                    'view': xml_ids[view.view.id] if view.view else None,
+                    'user': view.user.login if view.user else None,
+                    'group': group_refs[view.group.id] if view.group else None,
+                    'parent': (group_refs[view.parent.group.id]
+                        if view.parent else None),
+                    'sequence': view.sequence,
+                    'active': view.active,
+                    'lines': lines[view.id],
+                    'snapshot': snapshots[view.id],
+                    }
+
+    @classmethod
+    def _get_xml_ids(cls, model, ids):
+        "Return the XML ids as module.fs_id of the records of the model"
+        pool = Pool()
+        ModelData = pool.get('ir.model.data')
+        xml_ids = {}
+        for sub_ids in grouped_slice(list(ids)):
+            for data in ModelData.search([
+                        ('model', '=', model),
+                        ('db_id', 'in', list(sub_ids)),
+                        ]):
+                xml_ids[data.db_id] = '%s.%s' % (data.module, data.fs_id)
+        return xml_ids
+
+    @classmethod
+    def _get_xml_id_references(cls, model, xml_ids):
+        "Return the ids of the records of the model for the XML ids"
+        pool = Pool()
+        ModelData = pool.get('ir.model.data')
+        ids = {}
+        for xml_id in xml_ids:
+            if '.' not in xml_id:
+                continue
+            module, fs_id = xml_id.split('.', 1)
+            data = ModelData.search([
+                    ('model', '=', model),
+                    ('module', '=', module),
+                    ('fs_id', '=', fs_id),
+                    ], limit=1)
+            if data:
+                ids[xml_id] = data[0].db_id
+        return ids
+
+    @classmethod
+    def _get_import_references(cls, records, references):
+        "Add to references the ids of the names used by the records"
+        pool = Pool()
+        Model = pool.get('ir.model')
+        User = pool.get('res.user')
+        Group = pool.get('res.group')
+
+        def missing(kind, names):
+            return {n for n in names if n and n not in references[kind]}
+
+        names = missing('model', (r['model'] for r in records))
+        if names:
+            references['model'].update((m.name, m.id)
+                for m in Model.search([('name', 'in', list(names))]))
+        names = missing('user', (r.get('user') for r in records))
+        if names:
+            references['user'].update((u.login, u.id)
+                for u in User.search([('login', 'in', list(names))]))
+        names = missing('group', (n for r in records
+                for n in [r.get('group'), r.get('parent')]))
+        if names:
+            found = cls._get_xml_id_references('res.group', names)
+            references['group'].update(found)
+            # The groups without XML id are referenced by their name which
+            # is only used when it is unique
+            by_name = defaultdict(list)
+            for group in Group.search([
+                        ('name', 'in', list(names - found.keys())),
+                        ]):
+                by_name[group.name].append(group.id)
+            references['group'].update(
+                (n, ids[0]) for n, ids in by_name.items() if len(ids) == 1)
+        names = missing('view', (r.get('view') for r in records))
+        if names:
+            references['view'].update(
+                cls._get_xml_id_references('ir.ui.view', names))
+        for kind in ['ir.model.field', 'ir.model.button']:
+            Resource = pool.get(kind)
+            names = defaultdict(set)
+            for model, name in missing(kind, ((r['model'], i['name'])
+                        for r in records
+                        for i in chain(
+                            r.get('lines') or [], r.get('snapshot') or [])
+                        if i['type'] == kind)):
+                names[model].add(name)
+            for model, model_names in names.items():
+                references[kind].update(((model, r.name), r.id)
+                    for r in Resource.search([
+                            ('model.name', '=', model),
+                            ('name', 'in', list(model_names)),
+                            ]))
+
+    @classmethod
+    def _get_import_parent(cls, record, view_id, references):
+        "Return the id of the group configurator parent of the record"
+        group_id = references['group'].get(record.get('parent'))
+        if group_id is None:
+            return None
+        key = (record['model'], view_id, group_id)
+        if key not in references['parent']:
+            parents = cls.search([
+                    ('model_name', '=', record['model']),
+                    ('view', '=', view_id),
+                    ('group', '=', group_id),
+                    ('user', '=', None),
+                    ], limit=1)
+            if not parents:
+                return None
+            references['parent'][key] = parents[0].id
+        return references['parent'][key]
+
+    @classmethod
+    def _create_import_configurators(cls, records, references):
+        "Create the configurators and return pairs of configurator and record"
+        vlist, imported = [], []
+        for record in records:
+            model_id = references['model'].get(record['model'])
+            view_id = references['view'].get(record.get('view'))
+            user_id = references['user'].get(record.get('user'))
+            group_id = references['group'].get(record.get('group'))
+            parent_id = cls._get_import_parent(record, view_id, references)
+            if (model_id is None
+                    or (record.get('view') and view_id is None)
+                    or (record.get('user') and user_id is None)
+                    or (record.get('group') and group_id is None)
+                    or (record.get('parent') and parent_id is None)):
+                logger.warning("skip view configurator of %s: "
+                    "unknown reference", record['model'])
+                continue
+            vlist.append({
+                    'model': model_id,
+                    'view': view_id,
+                    'user': user_id,
+                    'group': group_id,
+                    'parent': parent_id,
+                    'sequence': record.get('sequence'),
+                    'active': record.get('active', True),
+                    })
+            imported.append(record)
+        return zip(cls.create(vlist), imported)
+
+    @classmethod
+    def import_configurators(cls, records, chunk_size=None):
+        """Create the configurators from the dictionaries yielded by
+        export_configurators
+
+        records may be any iterable, it is consumed by chunks of chunk_size
+        records with one create per table. The snapshots are completed from
+        the base views and the caches cleared once at the end. The records
+        without snapshot get one from their base view without adding lines.
+        Records with unknown references are skipped.
+        Return the ids of the created configurators.
+        """
+        pool = Pool()
+        FieldLine = pool.get('view.configurator.line.field')
+        ButtonLine = pool.get('view.configurator.line.button')
+        Snapshot = pool.get('view.configurator.snapshot')
+
+        if chunk_size is None:
+            chunk_size = config.getint(
+                'view_configurator', 'import_chunk', default=1000)
+        references = defaultdict(dict)
+        created, without_snapshot = [], set()
+        model_names = set()
+        records = iter(records)
+        with Transaction().set_context(view_configurator_defer=True):
+            while True:
+                chunk = list(islice(records, chunk_size))
+                if not chunk:
+                    break
+                cls._get_import_references(chunk, references)
+                # The parents must exist before their user configurators
+                views = chain(
+                    cls._create_import_configurators(
+                        [r for r in chunk if not r.get('parent')],
+                        references),
+                    cls._create_import_configurators(
+                        [r for r in chunk if r.get('parent')], references))
+                field_lines, button_lines, snapshots = [], [], []
+                for view, record in views:
+                    model_names.add(view.model_name)
+                    created.append(view.id)
+                    for line in record.get('lines') or []:
+                        resource_id = references[line['type']].get(
+                            (view.model_name, line['name']))
+                        if resource_id is None:
+                            logger.warning("skip line %s of %s: unknown "
+                                "reference", line['name'], view.model_name)
+                            continue
+                        values = {
+                            'view': view.id,
+                            'type': line['type'],
+                            'sequence': line.get('sequence'),
+                            'expand': line.get('expand'),
+                            'optional': line.get('optional'),
+                            'searchable': line.get('searchable'),
+                            'removed': line.get('removed'),
+                            }
+                        if line['type'] == 'ir.model.field':
+                            values['field'] = resource_id
+                            values['sum_'] = line.get('sum_')
+                            field_lines.append(values)
+                        else:
+                            values['button'] = resource_id
+                            button_lines.append(values)
+                    if record.get('snapshot') is None:
+                        without_snapshot.add(view.id)
+                        continue
+                    for item in record['snapshot']:
+                        resource_id = references[item['type']].get(
+                            (view.model_name, item['name']))
+                        if resource_id is not None:
+                            snapshots.append({
+                                    'view': view.id,
+                                    item['type'].rsplit('.', 1)[-1]: (
+                                        resource_id),
+                                    })
+                FieldLine.create(field_lines)
+                ButtonLine.create(button_lines)
+                Snapshot.create(snapshots)
+
+        for sub_ids in grouped_slice(created, chunk_size):
+            views = cls.browse(list(sub_ids))
+            cls.create_snapshots(
+                [v for v in views if v.id not in without_snapshot])
+            cls.create_snapshots(
+                [v for v in views if v.id in without_snapshot], lines=False)
+        # The configured models are not known before the import
+        cls.clear_resolution(model_names)
+        cls._resolution_cache.clear()
+        cls._queue_warm_up(cls.browse(created))
+        return created
+
+    @classmethod
+    def resequence(cls, views, line_ids):
+        """Set the sequence of the lines of the configurators following the
+        order of line_ids
+
+        line_ids are ids of view.configurator.line, the lines of other
+        configurators are ignored. The tables are updated with one statement
+        per table and chunk, and the compiled views are invalidated once.
+        """
+        pool = Pool()
+        ModelAccess = pool.get('ir.model.access')
+        Line = pool.get('view.configurator.line')
+        transaction = Transaction()
+        cursor = transaction.connection.cursor()
+
+        sequences = defaultdict(dict)
+        for sequence, line_id in enumerate(line_ids, 1):
+            record = Line.union_unshard(int(line_id))
+            sequences[record.__name__][record.id] = sequence
+
+        view_ids = [v.id for v in views]
+        for model, model_sequences in sequences.items():
+            ModelAccess.check(model, 'write')
+            Model = pool.get(model)
+            table = Model.__table__()
+            for sub_ids in grouped_slice(list(model_sequences)):
+                sub_ids = list(sub_ids)
+                cursor.execute(*table.update(
+                        [table.sequence, table.write_uid, table.write_date],
+                        [Case(*((table.id == i, model_sequences[i])
+                                    for i in sub_ids),
+                                else_=table.sequence),
+                            transaction.user, CurrentTimestamp()],
+                        where=reduce_ids(table.id, sub_ids)
+                        & table.view.in_(view_ids)))
+        cls.invalidate(views)
 
     @classmethod
     @ModelView.button
     def do_snapshot(cls, views):
-        for view in views:
-            view.create_snapshot()
+        cls.create_snapshots(views)
 
 
-class ViewConfiguratorLineButton(sequence_ordered(), ModelSQL, ModelView):
+class ViewConfiguratorLineButton(ConfiguratorInvalidateMixin,
+        sequence_ordered(), ModelSQL, ModelView):
     '''View Configurator Line Button'''
     __name__ = 'view.configurator.line.button'
 
@@ -371,12 +1848,20 @@ class ViewConfiguratorLineButton(sequence_ordered(), ModelSQL, ModelView):
             ('hide', 'Hide'),
             ], 'Optional')
     searchable = fields.Boolean('Searchable')
+    removed = fields.Boolean('Removed')
     type = fields.Selection([
         ('ir.model.button', 'Button'),
         ], 'Type')
     parent_model = fields.Function(fields.Char('Model'),
         'on_change_with_parent_model')
 
+    @classmethod
+    def __setup__(cls):
+        super().__setup__()
+        t = cls.__table__()
+        cls._sql_indexes.add(
+            Index(t, (t.view, Index.Equality()), (t.sequence, Index.Range())))
+
     @staticmethod
     def default_type():
         return 'ir.model.button'
@@ -386,7 +1871,8 @@ class ViewConfiguratorLineButton(sequence_ordered(), ModelSQL, ModelView):
         return self.view.model.name if self.view else None
 
 
-class ViewConfiguratorLineField(sequence_ordered(), ModelSQL, ModelView):
+class ViewConfiguratorLineField(ConfiguratorInvalidateMixin,
+        sequence_ordered(), ModelSQL, ModelView):
     '''View Configurator Line Field'''
     __name__ = 'view.configurator.line.field'
 
@@ -403,6 +1889,7 @@ class ViewConfiguratorLineField(sequence_ordered(), ModelSQL, ModelView):
             ('hide', 'Hide'),
             ], 'Optional')
     searchable = fields.Boolean('Searchable')
+    removed = fields.Boolean('Removed')
     type = fields.Selection([
         ('ir.model.field', 'Field'),
         ], 'Type')
@@ -410,6 +1897,13 @@ class ViewConfiguratorLineField(sequence_ordered(), ModelSQL, ModelView):
         'on_change_with_parent_model')
     sum_ = fields.Boolean('Sum')
 
+    @classmethod
+    def __setup__(cls):
+        super().__setup__()
+        t = cls.__table__()
+        cls._sql_indexes.add(
+            Index(t, (t.view, Index.Equality()), (t.sequence, Index.Range())))
+
     @staticmethod
     def default_type():
         return 'ir.model.field'
@@ -456,6 +1950,8 @@ class ViewConfiguratorLine(UnionMixin, ModelSQL, ModelView):
         "set to 'Show', the field is optional and shown by default. If set "
         "to 'Hide', the field is optional and hidden by default.")
     searchable = fields.Boolean('Searchable')
+    removed = fields.Boolean('Removed',
+        help="Remove the column of the parent configurator.")
     sum_ = fields.Boolean('Sum', states={
             'invisible': (Eval('type') != 'ir.model.field')
             })
@@ -469,6 +1965,10 @@ class ViewConfiguratorLine(UnionMixin, ModelSQL, ModelView):
     def default_searchable():
         return False
 
+    @staticmethod
+    def default_removed():
+        return False
+
     @staticmethod
     def default_type():
         return 'ir.model.field'
@@ -492,47 +1992,59 @@ class ViewConfiguratorLine(UnionMixin, ModelSQL, ModelView):
         return super().union_column(name,
             field, table, Model)
 
+    @classmethod
+    def _group_by_model(cls, lines):
+        "Return the records of the union models grouped by model name"
+        records = defaultdict(list)
+        for line in lines:
+            record = cls.union_unshard(line.id)
+            records[record.__name__].append(record)
+        return records
+
     @classmethod
     def create(cls, vlist):
         pool = Pool()
 
-        vlist = [x.copy() for x in vlist]
         models_to_create = defaultdict(list)
-        for line in vlist:
+        for index, line in enumerate(vlist):
             type_ = 'view.configurator.line.field'
-            if 'button' in line['type'] :
+            if 'button' in line['type']:
                 type_ = 'view.configurator.line.button'
-                if 'field' in line:
-                    del line['field']
-            else:
-                if 'button' in line:
-                    del line['button']
-            models_to_create[type_].append(line)
+            models_to_create[type_].append((index, line))
 
+        ids = [None] * len(vlist)
         for model, arguments in models_to_create.items():
             Model = pool.get(model)
-            Model.create(arguments)
+            records = Model.create([
+                    {k: v for k, v in line.items() if k in Model._fields}
+                    for _, line in arguments])
+            for (index, _), record in zip(arguments, records):
+                ids[index] = cls.union_shard(record.id, model)
+        return cls.browse(ids)
 
     @classmethod
     def write(cls, *args):
         pool = Pool()
-        models_to_write = defaultdict(list)
+        # Group the records per model and then per identical values
+        models_to_write = defaultdict(dict)
         actions = iter(args)
-        for models, values in zip(actions, actions):
-            for model in models:
-                record = cls.union_unshard(model.id)
-                models_to_write[record.__name__].extend(([record], values))
-        for model, arguments in models_to_write.items():
+        for lines, values in zip(actions, actions):
+            for model, records in cls._group_by_model(lines).items():
+                Model = pool.get(model)
+                model_values = {k: v for k, v in values.items()
+                    if k in Model._fields}
+                key = freeze(model_values)
+                if key in models_to_write[model]:
+                    models_to_write[model][key][0].extend(records)
+                else:
+                    models_to_write[model][key] = (records, model_values)
+        for model, groups in models_to_write.items():
             Model = pool.get(model)
-            Model.write(*arguments)
+            Model.write(*chain(*groups.values()))
 
     @classmethod
     def delete(cls, lines):
         pool = Pool()
-        models_to_delete = defaultdict(list)
-        for model in lines:
-            record = cls.union_unshard(model.id)
-            models_to_delete[record.__name__].append(record)
-        for model, records in models_to_delete.items():
+        for model, records in cls._group_by_model(lines).items():
             Model = pool.get(model)
             Model.delete(records)
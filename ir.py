@@ -0,0 +1,71 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+from trytond.pool import Pool, PoolMeta
+
+from .configurator import CompiledViewsClearMixin
+
+
+class ModelField(CompiledViewsClearMixin, metaclass=PoolMeta):
+    __name__ = 'ir.model.field'
+
+
+class ModelButton(CompiledViewsClearMixin, metaclass=PoolMeta):
+    __name__ = 'ir.model.button'
+
+
+class ModelAccess(CompiledViewsClearMixin, metaclass=PoolMeta):
+    __name__ = 'ir.model.access'
+
+
+class ModelFieldAccess(CompiledViewsClearMixin, metaclass=PoolMeta):
+    __name__ = 'ir.model.field.access'
+
+
+class Translation(CompiledViewsClearMixin, metaclass=PoolMeta):
+    __name__ = 'ir.translation'
+
+    @classmethod
+    def _clears_compiled_views(cls, records):
+        # The translations of the record values are not in the views
+        return any(t.type in {'field', 'help', 'selection', 'view'}
+            for t in records)
+
+
+class Module(CompiledViewsClearMixin, metaclass=PoolMeta):
+    __name__ = 'ir.module'
+
+
+class ViewTreeOptional(metaclass=PoolMeta):
+    __name__ = 'ir.ui.view_tree_optional'
+
+    @classmethod
+    def _clear_tree_optionals(cls):
+        pool = Pool()
+        ViewConfigurator = pool.get('view.configurator')
+        ViewConfigurator._tree_optionals_cache.clear()
+
+    @classmethod
+    def create(cls, vlist):
+        records = super().create(vlist)
+        cls._clear_tree_optionals()
+        return records
+
+    @classmethod
+    def write(cls, *args):
+        super().write(*args)
+        cls._clear_tree_optionals()
+
+    @classmethod
+    def delete(cls, records):
+        super().delete(records)
+        cls._clear_tree_optionals()
+
+
+class Cron(metaclass=PoolMeta):
+    __name__ = 'ir.cron'
+
+    @classmethod
+    def __setup__(cls):
+        super().__setup__()
+        cls.method.selection.append(
+            ('view.configurator|warm_up', "Warm Up Configured Views"))
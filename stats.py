@@ -0,0 +1,71 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from threading import Lock
+
+from trytond.config import config
+
+logger = logging.getLogger(__name__)
+
+
+def slow_threshold():
+    "Return the duration in seconds above which a slow path is logged"
+    return config.getfloat('view_configurator', 'slow_threshold', default=0.5)
+
+
+class Statistics:
+    "Counters and timers of the view configurator for the current worker"
+
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._started = time.time()
+            self._counters = defaultdict(lambda: defaultdict(int))
+            self._timers = defaultdict(lambda: {
+                    'count': 0, 'total': 0., 'max': 0.})
+
+    def count(self, name, model=None, value=1):
+        "Increment the counter name of the model"
+        with self._lock:
+            self._counters[name][model] += value
+
+    def record(self, name, duration, model=None):
+        "Record the duration in seconds of name for the model"
+        with self._lock:
+            timer = self._timers[name]
+            timer['count'] += 1
+            timer['total'] += duration
+            timer['max'] = max(timer['max'], duration)
+        if duration > slow_threshold():
+            logger.warning("slow %s for %s: %.3fs", name, model, duration)
+
+    @contextmanager
+    def timer(self, name, model=None):
+        "Time the block as name for the model"
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, model)
+
+    def get(self):
+        "Return a copy of the statistics"
+        with self._lock:
+            return {
+                'since': self._started,
+                'counters': {
+                    name: {str(k): v for k, v in counter.items()}
+                    for name, counter in self._counters.items()},
+                'timers': {
+                    name: dict(timer, mean=timer['total'] / timer['count'])
+                    for name, timer in self._timers.items()},
+                }
+
+
+statistics = Statistics()
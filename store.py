@@ -0,0 +1,226 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from copy import deepcopy
+from threading import Lock, RLock
+
+from trytond.config import config
+
+
+def budget():
+    "Return the size in bytes of the compiled views kept by the worker"
+    return config.getint(
+        'view_configurator', 'cache_budget', default=32 * 1024 * 1024)
+
+
+def model_budget():
+    "Return the size in bytes of the compiled views kept per model"
+    return config.getint(
+        'view_configurator', 'cache_model_budget', default=budget() // 4)
+
+
+def compile_timeout():
+    "Return the seconds to wait for the compilation of another caller"
+    return config.getfloat(
+        'view_configurator', 'compile_timeout', default=10)
+
+
+def definition_size(value):
+    "Return the approximate size in bytes of the value"
+    return len(repr(value).encode())
+
+
+class CompiledViewStore:
+    """Least recently used store of the compiled views of the worker
+
+    The store is bounded by the budget and each model by the model budget,
+    so the views of a few wide models can not evict all the others.
+    The field definitions are interned in a table per fields key (model,
+    level, language and groups) shared by all the views of the key, so an
+    entry only keeps its arch and the names of its fields.
+    The definitions are copied when stored so they are not shared with the
+    caller, the views returned share them and must not be modified.
+    """
+
+    def __init__(self, budget=None, model_budget=None):
+        # The budgets of the configuration are used when not given
+        self._budget = budget
+        self._model_budget = model_budget
+        self._lock = Lock()
+        self._evictions = defaultdict(int)
+        self._rejections = defaultdict(int)
+        self.clear()
+
+    def budgets(self):
+        "Return the budget and the model budget in bytes"
+        return (
+            budget() if self._budget is None else self._budget,
+            model_budget() if self._model_budget is None
+            else self._model_budget)
+
+    def clear(self):
+        "Drop all the compiled views but keep the eviction statistics"
+        with self._lock:
+            self._entries = OrderedDict()
+            self._tables = {}
+            self._size = 0
+            self._model_sizes = defaultdict(int)
+            self._model_counts = defaultdict(int)
+
+    def get(self, key):
+        "Return the compiled view of key or None"
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            _, _, fields_key, (result, names, own, optional_names) = entry
+            table = self._tables[fields_key]['fields']
+            definitions = {
+                n: own[n] if n in own else table[n] for n in names}
+        result = dict(result)
+        result['fields'] = definitions
+        return result, optional_names
+
+    def set(self, key, model, compiled, fields_key):
+        """Store the compiled view of the model under key
+
+        The view is rejected when it can not fit in the budgets, including
+        the definitions it adds to the table of its fields key.
+        """
+        result, optional_names = compiled
+        total, per_model = self.budgets()
+        with self._lock:
+            self._pop(key)
+            # The reference keeps the table while making room for the entry
+            table = self._tables.setdefault(fields_key, {
+                    'model': model,
+                    'fields': {},
+                    'size': 0,
+                    'references': 0,
+                    })
+            table['references'] += 1
+            own, new = {}, {}
+            for name, definition in result.get('fields', {}).items():
+                shared = table['fields'].get(name)
+                if shared is None:
+                    new[name] = definition
+                elif shared != definition:
+                    own[name] = definition
+            entry_result = {
+                k: v for k, v in result.items() if k != 'fields'}
+            names = tuple(result.get('fields', {}))
+            size = (len(entry_result.get('arch', '').encode())
+                + definition_size(names) + definition_size(own))
+            added = sum(definition_size(d) for d in new.values())
+            size += added
+
+            # The table is kept by the reference so it can not be evicted
+            if table['size'] + size > min(total, per_model):
+                self._rejections[model] += 1
+                self._release(fields_key)
+                return
+            if self._model_sizes[model] + size > per_model:
+                for other in [k for k, e in self._entries.items()
+                        if e[0] == model]:
+                    self._pop(other, evicted=True)
+                    if self._model_sizes[model] + size <= per_model:
+                        break
+            while self._entries and self._size + size > total:
+                self._pop(next(iter(self._entries)), evicted=True)
+            table['fields'].update(deepcopy(new))
+            table['size'] += added
+            self._entries[key] = (model, size - added, fields_key,
+                (entry_result, names, deepcopy(own), optional_names))
+            self._size += size
+            self._model_sizes[model] += size
+            self._model_counts[model] += 1
+
+    def _pop(self, key, evicted=False):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        model, size, fields_key, _ = entry
+        self._size -= size
+        self._model_sizes[model] -= size
+        self._model_counts[model] -= 1
+        self._release(fields_key)
+        if evicted:
+            self._evictions[model] += 1
+
+    def _release(self, fields_key):
+        table = self._tables[fields_key]
+        table['references'] -= 1
+        if not table['references']:
+            del self._tables[fields_key]
+            self._size -= table['size']
+            self._model_sizes[table['model']] -= table['size']
+
+    def get_stats(self):
+        "Return the sizes, counts and evictions of the store"
+        total, per_model = self.budgets()
+        with self._lock:
+            return {
+                'budget': total,
+                'model_budget': per_model,
+                'size': self._size,
+                'count': len(self._entries),
+                'tables': len(self._tables),
+                'models': {
+                    model: {
+                        'size': self._model_sizes[model],
+                        'count': self._model_counts[model],
+                        'evictions': self._evictions[model],
+                        'rejections': self._rejections[model],
+                        }
+                    for model in (set(self._model_sizes)
+                        | set(self._evictions) | set(self._rejections))},
+                }
+
+
+_stores = {}
+_stores_lock = Lock()
+
+
+def compiled_views(database_name):
+    """Return the store of the compiled views of the database
+
+    A worker may serve many databases with the same configurator ids, so
+    each database has its own store.
+    """
+    store = _stores.get(database_name)
+    if store is None:
+        with _stores_lock:
+            store = _stores.setdefault(database_name, CompiledViewStore())
+    return store
+
+
+_flights = {}
+_flights_lock = Lock()
+
+
+@contextmanager
+def single_flight(key):
+    """Run the block for key once at a time in the process
+
+    The callers of the same key wait for the one running the block, up to
+    compile_timeout seconds, so they can use its result.
+    """
+    with _flights_lock:
+        lock, count = _flights.get(key, (None, 0))
+        if lock is None:
+            lock = RLock()
+        _flights[key] = (lock, count + 1)
+    acquired = lock.acquire(timeout=compile_timeout())
+    try:
+        yield
+    finally:
+        if acquired:
+            lock.release()
+        with _flights_lock:
+            lock, count = _flights[key]
+            if count > 1:
+                _flights[key] = (lock, count - 1)
+            else:
+                del _flights[key]
@@ -0,0 +1,207 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+"""Benchmark of the view configurator hot paths
+
+It creates configurators for N models with M lines each and K users on a
+SQLite database and measures:
+
+    - fields_view_get with a cold, a warm and an invalidated cache
+    - create_snapshots of new configurators and get_difference, both
+      without cached base trees
+    - get_custom_view throughput
+
+Run it with:
+
+    DB_NAME=:memory: TRYTOND_DATABASE_URI=sqlite:// \\
+        python -m trytond.modules.view_configurator.tests.benchmark \\
+        --models 10 --lines 20 --users 5 --output results.json
+
+The results are written as JSON so they can be compared between runs.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+
+from trytond.model import ModelSQL, ModelView
+from trytond.pool import Pool
+from trytond.tests.test_tryton import DB_NAME, activate_module
+from trytond.transaction import Transaction
+
+EXCLUDED_FIELDS = {'id', 'create_uid', 'create_date', 'write_uid',
+    'write_date', 'rec_name'}
+
+
+def summarize(durations):
+    "Return the statistics of the durations in milliseconds"
+    durations = sorted(d * 1000 for d in durations)
+    if not durations:
+        return {'count': 0}
+    return {
+        'count': len(durations),
+        'min': durations[0],
+        'max': durations[-1],
+        'mean': statistics.mean(durations),
+        'median': statistics.median(durations),
+        'p95': durations[min(len(durations) - 1,
+                int(round(len(durations) * 0.95)))],
+        }
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def select_models(count, lines):
+    "Return up to count configurable models with at least lines fields"
+    pool = Pool()
+    IrModel = pool.get('ir.model')
+
+    models = []
+    for model in IrModel.search([], order=[('id', 'ASC')]):
+        if model.name.startswith('view.configurator'):
+            continue
+        try:
+            Model = pool.get(model.name)
+        except KeyError:
+            continue
+        if (not issubclass(Model, ModelView)
+                or not issubclass(Model, ModelSQL)
+                or Model.table_query()):
+            continue
+        fields = [f for f in model.fields if f.name not in EXCLUDED_FIELDS]
+        if len(fields) < lines:
+            continue
+        models.append((model, fields[:lines]))
+        if len(models) >= count:
+            break
+    return models
+
+
+def setup(models, users):
+    "Create a global configurator per model and one per model and user"
+    pool = Pool()
+    Configurator = pool.get('view.configurator')
+    ConfiguratorLine = pool.get('view.configurator.line')
+    User = pool.get('res.user')
+
+    user_ids = [u.id for u in User.create([{
+                    'name': 'Benchmark %s' % i,
+                    'login': 'benchmark_%s' % i,
+                    } for i in range(users)])]
+    vlist = []
+    for model, _ in models:
+        vlist.append({'model': model.id})
+        vlist.extend({'model': model.id, 'user': u} for u in user_ids)
+    configurators = Configurator.create(vlist)
+
+    by_model = {m.id: f for m, f in models}
+    ConfiguratorLine.delete([l for c in configurators for l in c.lines])
+    ConfiguratorLine.create([{
+                'view': c.id,
+                'type': 'ir.model.field',
+                'field': f.id,
+                'sequence': i,
+                }
+            for c in configurators
+            for i, f in enumerate(by_model[c.model.id])])
+    return user_ids, configurators
+
+
+def fields_view_get(models, user_ids):
+    pool = Pool()
+    transaction = Transaction()
+    durations = []
+    for model, _ in models:
+        Model = pool.get(model.name)
+        for user_id in user_ids:
+            with transaction.set_user(user_id):
+                durations.append(timed(
+                        Model.fields_view_get, view_type='tree'))
+    return durations
+
+
+def run(args):
+    pool = Pool()
+    Configurator = pool.get('view.configurator')
+    transaction = Transaction()
+    results = {
+        'parameters': {
+            'models': args.models,
+            'lines': args.lines,
+            'users': args.users,
+            },
+        'python': platform.python_version(),
+        }
+
+    models = select_models(args.models, args.lines)
+    results['parameters']['selected_models'] = [m.name for m, _ in models]
+    user_ids, configurators = setup(models, args.users)
+    transaction.commit()
+
+    Configurator.clear_compiled_views()
+    transaction.commit()
+    results['fields_view_get_cold'] = summarize(
+        fields_view_get(models, user_ids))
+    results['fields_view_get_warm'] = summarize(
+        fields_view_get(models, user_ids))
+
+    Configurator.invalidate(configurators)
+    transaction.commit()
+    results['fields_view_get_invalidated'] = summarize(
+        fields_view_get(models, user_ids))
+
+    durations = []
+    for configurator in configurators:
+        Configurator._base_tree_cache.clear()
+        durations.append(timed(configurator.get_difference))
+    results['get_difference'] = summarize(durations)
+
+    # Without snapshot nor base fingerprint, nothing is skipped
+    with transaction.set_context(view_configurator_defer=True):
+        snapshot_configurators = Configurator.create(
+            [{'model': m.id} for m, _ in models])
+    Configurator._base_tree_cache.clear()
+    results['create_snapshots'] = summarize(
+        [timed(Configurator.create_snapshots, snapshot_configurators)])
+    transaction.rollback()
+
+    durations = []
+    for model, _ in models:
+        for user_id in user_ids:
+            with transaction.set_user(user_id):
+                durations.append(timed(
+                        Configurator.get_custom_view, model.name, None))
+    total = sum(durations)
+    results['get_custom_view'] = summarize(durations)
+    results['get_custom_view']['per_second'] = (
+        len(durations) / total if total else None)
+    transaction.rollback()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--models', type=int, default=10,
+        help="number of configured models")
+    parser.add_argument('--lines', type=int, default=20,
+        help="number of lines per configurator")
+    parser.add_argument('--users', type=int, default=5,
+        help="number of users with their own configurator")
+    parser.add_argument('--output', type=argparse.FileType('w'),
+        default=sys.stdout, help="file to write the JSON results")
+    args = parser.parse_args(argv)
+
+    activate_module('view_configurator')
+    with Transaction().start(DB_NAME, 0):
+        results = run(args)
+    json.dump(results, args.output, indent=2, sort_keys=True)
+    args.output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
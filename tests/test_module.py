@@ -2,8 +2,25 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
 
+import threading
+import time
+import unittest
+
+from lxml import etree
+
+from trytond.config import config
+from trytond.model.exceptions import AccessError
 from trytond.tests.test_tryton import ModuleTestCase, with_transaction
 from trytond.pool import Pool
+from trytond.transaction import Transaction
+
+from trytond.modules.view_configurator.configurator import (
+    ConfigurableModelView, ModelViewMixin, _transaction_resolutions,
+    is_configurable)
+from trytond.modules.view_configurator.store import (
+    CompiledViewStore, _flights, compiled_views, definition_size,
+    single_flight)
+from trytond.modules.view_configurator.view import _queued_models
 
 
 class ViewConfiguratorTestCase(ModuleTestCase):
@@ -106,4 +123,963 @@ class ViewConfiguratorTestCase(ModuleTestCase):
             self.assertEqual(view['type'], 'form')
             self.assertEqual(view['arch'].startswith("<form><label"), True)
 
+    @with_transaction()
+    def test_invalidate(self):
+        'Bump the generation and recompile when the configurator changes'
+        pool = Pool()
+        Configurator = pool.get('view.configurator')
+        ConfiguratorLine = pool.get('view.configurator.line')
+        Snapshot = pool.get('view.configurator.snapshot')
+        Model = pool.get('ir.model')
+        ModelField = pool.get('ir.model.field')
+        Attachment = pool.get('ir.attachment')
+
+        def generation():
+            record, = Configurator.read([conf1.id], ['generation'])
+            return record['generation']
+
+        model, = Model.search([
+            ('name', '=', 'ir.attachment')
+            ], limit=1)
+        fields = dict((f.name, f) for f in ModelField.search([
+            ('model.name', '=', 'ir.attachment')
+            ]))
+
+        conf1 = Configurator(model=model)
+        conf1.save()
+        ConfiguratorLine.delete(conf1.lines)
+        conf1 = Configurator(conf1.id)
+        conf1.lines = [{
+            'type': 'ir.model.field',
+            'field': fields.get('name'),
+            }]
+        conf1.save()
+        view = Attachment.fields_view_get(view_type='tree')
+        self.assertEqual(view['arch'], '<tree><field name="name"/></tree>')
+
+        line, = conf1.lines
+        before = generation()
+        ConfiguratorLine.write([line], {'field': fields['description'].id})
+        self.assertGreater(generation(), before)
+        view = Attachment.fields_view_get(view_type='tree')
+        self.assertEqual(
+            view['arch'], '<tree><field name="description"/></tree>')
+
+        before = generation()
+        Snapshot.delete(Snapshot.search([('view', '=', conf1.id)], limit=1))
+        self.assertGreater(generation(), before)
+
+        before = generation()
+        Configurator.write([conf1], {'sequence': 5})
+        self.assertGreater(generation(), before)
+
+    @with_transaction()
+    def test_line_union(self):
+        'Create, write and delete field and button lines at once'
+        pool = Pool()
+        Configurator = pool.get('view.configurator')
+        ConfiguratorLine = pool.get('view.configurator.line')
+        Model = pool.get('ir.model')
+        ModelField = pool.get('ir.model.field')
+        Button = pool.get('ir.model.button')
+
+        model, = Model.search([
+            ('name', '=', 'ir.module')
+            ], limit=1)
+        field, = ModelField.search([
+            ('model.name', '=', 'ir.module'),
+            ('name', '=', 'name'),
+            ])
+        button, = Button.search([('model', '=', 'ir.module')], limit=1)
+        conf1 = Configurator(model=model)
+        conf1.save()
+
+        lines = ConfiguratorLine.create([{
+                    'view': conf1.id,
+                    'type': 'ir.model.field',
+                    'field': field.id,
+                    'sequence': 1,
+                    }, {
+                    'view': conf1.id,
+                    'type': 'ir.model.button',
+                    'button': button.id,
+                    'sequence': 2,
+                    }, {
+                    'view': conf1.id,
+                    'type': 'ir.model.field',
+                    'field': field.id,
+                    'sequence': 3,
+                    }])
+        self.assertEqual(len({l.id for l in lines}), 3)
+        self.assertEqual(
+            [(l.type, l.field, l.button, l.sequence) for l in lines], [
+                ('ir.model.field', field, None, 1),
+                ('ir.model.button', None, button, 2),
+                ('ir.model.field', field, None, 3),
+                ])
+
+        ConfiguratorLine.write(
+            lines[:2], {'expand': 5, 'searchable': True},
+            lines[2:], {'expand': 7, 'searchable': True})
+        lines = ConfiguratorLine.browse([l.id for l in lines])
+        self.assertEqual(
+            [(l.expand, l.searchable) for l in lines],
+            [(5, True), (5, True), (7, True)])
+
+        ConfiguratorLine.delete(lines)
+        self.assertFalse(ConfiguratorLine.search([
+                    ('id', 'in', [l.id for l in lines]),
+                    ]))
+
+    @with_transaction()
+    def test_compiled_access(self):
+        'Only the administrators access the compiled views'
+        pool = Pool()
+        ModelAccess = pool.get('ir.model.access')
+        User = pool.get('res.user')
+
+        other, = User.create([{'name': "Other", 'login': 'other'}])
+        with Transaction().set_context(_check_access=True):
+            self.assertTrue(
+                ModelAccess.check('view.configurator.compiled', 'write'))
+            with Transaction().set_user(other.id):
+                for mode in ['read', 'write', 'create', 'delete']:
+                    with self.assertRaises(AccessError):
+                        ModelAccess.check(
+                            'view.configurator.compiled', mode)
+
+    @with_transaction()
+    def test_compile_locked(self):
+        'Coordinate the compilation only for read-only transactions'
+        pool = Pool()
+        Configurator = pool.get('view.configurator')
+
+        self.assertFalse(Configurator.compile_locked())
+        if not config.has_section('view_configurator'):
+            config.add_section('view_configurator')
+        config.set('view_configurator', 'compile_lock', 'True')
+        self.addCleanup(
+            config.remove_option, 'view_configurator', 'compile_lock')
+        # The compiled view would not see the changes of the transaction
+        self.assertFalse(Configurator.compile_locked())
+
+    @with_transaction()
+    def test_translation_clear(self):
+        'Clear the compiled views only for the translations of the views'
+        pool = Pool()
+        Configurator = pool.get('view.configurator')
+        Compiled = pool.get('view.configurator.compiled')
+        Model = pool.get('ir.model')
+        Translation = pool.get('ir.translation')
+        Attachment = pool.get('ir.attachment')
+
+        model, = Model.search([
+            ('name', '=', 'ir.attachment')
+            ], limit=1)
+        Configurator(model=model).save()
+        Attachment.fields_view_get(view_type='tree')
+        self.assertTrue(Compiled.search([]))
+
+        Translation.write([], {'value': "Nom"})
+        Translation.create([{
+                    'name': 'ir.model,name',
+                    'lang': 'fr',
+                    'type': 'model',
+                    'res_id': model.id,
+                    'src': model.name,
+                    'value': "Pièce jointe",
+                    }])
+        self.assertTrue(Compiled.search([]))
+
+        Translation.create([{
+                    'name': 'ir.attachment,name',
+                    'lang': 'fr',
+                    'type': 'field',
+                    'res_id': -1,
+                    'src': "Name",
+                    'value': "Nom",
+                    }])
+        self.assertFalse(Compiled.search([]))
+
+    @with_transaction()
+    def test_snapshot_fingerprint(self):
+        'Skip the snapshot until the base tree changes'
+        pool = Pool()
+        Configurator = pool.get('view.configurator')
+        Model = pool.get('ir.model')
+        UiView = pool.get('ir.ui.view')
+
+        model, = Model.search([
+            ('name', '=', 'ir.attachment')
+            ], limit=1)
+        conf1 = Configurator(model=model)
+        conf1.save()
+        count = len(Configurator(conf1.id).lines)
+        self.assertTrue(Configurator(conf1.id).base_fingerprint)
+
+        Configurator.create_snapshots([Configurator(conf1.id)])
+        self.assertEqual(len(Configurator(conf1.id).lines), count)
+
+        base, = UiView.search([
+                ('model', '=', 'ir.attachment'),
+                ('type', '=', 'tree'),
+                ('inherit', '=', None),
+                ], limit=1)
+        UiView.create([{
+                    'model': 'ir.attachment',
+                    'inherit': base.id,
+                    'arch': '<data><xpath expr="/tree" position="inside">'
+                    '<field name="create_uid"/></xpath></data>',
+                    }])
+        Configurator.create_snapshots([Configurator(conf1.id)])
+        conf1 = Configurator(conf1.id)
+        self.assertEqual(len(conf1.lines), count + 1)
+        self.assertIn('create_uid',
+            [l.field.name for l in conf1.lines if l.field])
+
+    @with_transaction()
+    def test_snapshot_refresh_queue(self):
+        'Queue the snapshot refresh of the tree views once per transaction'
+        pool = Pool()
+        Configurator = pool.get('view.configurator')
+        Model = pool.get('ir.model')
+        UiView = pool.get('ir.ui.view')
+        Queue = pool.get('ir.queue')
+
+        def queued():
+            tasks = Queue.search([
+                    ('name', '=', 'view_configurator'),
+                    ], order=[('id', 'ASC')])
+            tasks = [t for t in tasks
+                if t.data['method'] == 'refresh_snapshots']
+            Queue.delete(tasks)
+            return [sorted(t.data['instances']) for t in tasks]
+
+        if not config.has_section('view_configurator'):
+            config.add_section('view_configurator')
+        config.set('view_configurator', 'snapshot_chunk', '2')
+        self.addCleanup(
+            config.remove_option, 'view_configurator', 'snapshot_chunk')
+
+        attachment, model_field = Model.search([
+                ('name', 'in', ['ir.attachment', 'ir.model.field']),
+                ], order=[('name', 'ASC')])
+        confs = Configurator.create([{'model': attachment.id}] * 3)
+        Configurator.create([{'model': model_field.id}])
+        expected = [
+            sorted(c.id for c in confs[:2]), sorted(c.id for c in confs[2:])]
+        queued()
+
+        UiView.create([{
+                    'model': 'ir.attachment',
+                    'type': 'form',
+                    'arch': '<form><field name="name"/></form>',
+                    }])
+        self.assertEqual(queued(), [])
+
+        tree, = UiView.create([{
+                    'model': 'ir.attachment',
+                    'type': 'tree',
+                    'arch': '<tree><field name="name"/></tree>',
+                    }])
+        self.assertEqual(queued(), expected)
+
+        # Once per transaction
+        inherit, = UiView.create([{
+                    'model': 'ir.attachment',
+                    'inherit': tree.id,
+                    'arch': '<data><xpath expr="/tree" position="inside">'
+                    '<field name="create_uid"/></xpath></data>',
+                    }])
+        self.assertEqual(queued(), [])
+
+        _queued_models.pop(Transaction(), None)
+        UiView.create([{
+                    'model': 'ir.attachment',
+                    'inherit': tree.id,
+                    'arch': '<data><xpath expr="/tree" position="inside">'
+                    '<field name="write_uid"/></xpath></data>',
+                    }])
+        self.assertEqual(queued(), expected)
+
+        _queued_models.pop(Transaction(), None)
+        UiView.write([inherit], {'priority': 20})
+        self.assertEqual(queued(), expected)
+        UiView.write([inherit], {'priority': 30})
+        self.assertEqual(queued(), [])
+
+    @with_transaction()
+    def test_resolution_precedence(self):
+        'Resolve user configurator before global one'
+        pool = Pool()
+        Configurator = pool.get('view.configurator')
+        Model = pool.get('ir.model')
+        User = pool.get('res.user')
+
+        model, = Model.search([
+            ('name', '=', 'ir.attachment')
+            ], limit=1)
+        user, = User.search([('login', '=', 'admin')])
+
+        self.assertFalse(Configurator.has_configurator('ir.attachment'))
+        self.assertIsNone(
+            Configurator.resolve_configurator('ir.attachment', None, user.id))
+
+        global_conf = Configurator(model=model)
+        global_conf.save()
+        user_conf = Configurator(model=model, user=user, sequence=20)
+        user_conf.save()
+
+        self.assertTrue(Configurator.has_configurator('ir.attachment'))
+        self.assertEqual(
+            Configurator.resolve_configurator('ir.attachment', None, user.id),
+            user_conf.id)
+        self.assertEqual(
+            Configurator.resolve_configurator('ir.attachment', None, None),
+            global_conf.id)
+
+    @with_transaction()
+    def test_group_configurator(self):
+        'Resolve group configurator and user changes'
+        pool = Pool()
+        Configurator = pool.get('view.configurator')
+        ConfiguratorLine = pool.get('view.configurator.line')
+        Model = pool.get('ir.model')
+        ModelField = pool.get('ir.model.field')
+        User = pool.get('res.user')
+        Attachment = pool.get('ir.attachment')
+
+        model, = Model.search([
+            ('name', '=', 'ir.attachment')
+            ], limit=1)
+        field, = ModelField.search([
+            ('model.name', '=', 'ir.attachment'),
+            ('name', '=', 'name'),
+            ])
+        user = User(Transaction().user)
+        group = user.groups[0]
+
+        global_conf = Configurator(model=model)
+        global_conf.save()
+        group_conf = Configurator(model=model, group=group)
+        group_conf.save()
+        self.assertEqual(
+            Configurator.resolve_configurator('ir.attachment', None, user.id),
+            group_conf.id)
+
+        user_conf_id = Configurator.get_custom_view('ir.attachment', None)
+        user_conf = Configurator(user_conf_id)
+        self.assertEqual(user_conf.parent, group_conf)
+        self.assertFalse(user_conf.lines)
+        self.assertFalse(user_conf.snapshot)
+        # Without changes the user shares the group configurator
+        self.assertEqual(
+            Configurator.resolve_configurator('ir.attachment', None, user.id),
+            group_conf.id)
+
+        ConfiguratorLine.create([{
+                    'view': user_conf.id,
+                    'type': 'ir.model.field',
+                    'field': field.id,
+                    'expand': 2,
+                    }])
+        self.assertEqual(
+            Configurator.resolve_configurator('ir.attachment', None, user.id),
+            user_conf.id)
+        view = Attachment.fields_view_get(view_type='tree')
+        arch = etree.fromstring(view['arch'])
+        self.assertEqual(len(arch.findall('field[@name="name"]')), 1)
+        self.assertEqual(arch.find('field[@name="name"]').get('expand'), '2')
+
+        other, = User.create([{'name': "Other", 'login': 'other'}])
+        self.assertEqual(
+            Configurator.resolve_configurator(
+                'ir.attachment', None, other.id),
+            global_conf.id)
+
+    @with_transaction()
+    def test_group_configurator_changes(self):
+        'Apply user changes in place and keep them when the group is deleted'
+        pool = Pool()
+        Configurator = pool.get('view.configurator')
+        ConfiguratorLine = pool.get('view.configurator.line')
+        Model = pool.get('ir.model')
+        User = pool.get('res.user')
+        Attachment = pool.get('ir.attachment')
+
+        def get_names():
+            view = Attachment.fields_view_get(view_type='tree')
+            arch = etree.fromstring(view['arch'])
+            return [f.get('name') for f in arch.iterfind('field')]
+
+        model, = Model.search([
+            ('name', '=', 'ir.attachment')
+            ], limit=1)
+        user = User(Transaction().user)
+        group_conf = Configurator(model=model, group=user.groups[0])
+        group_conf.save()
+        group_lines = [l for l in group_conf.lines if l.field]
+        changed, removed = group_lines[0], group_lines[1]
+
+        user_conf = Configurator(
+            Configurator.get_custom_view('ir.attachment', None))
+        ConfiguratorLine.create([{
+                    'view': user_conf.id,
+                    'type': 'ir.model.field',
+                    'field': changed.field.id,
+                    'sequence': 1000,
+                    'expand': 3,
+                    }, {
+                    'view': user_conf.id,
+                    'type': 'ir.model.field',
+                    'field': removed.field.id,
+                    'removed': True,
+                    }])
+        expected = [l.field.name for l in group_lines if l != removed]
+        names = get_names()
+        self.assertEqual([n for n in names if n in expected], expected)
+        self.assertNotIn(removed.field.name, names)
+        view = Attachment.fields_view_get(view_type='tree')
+        arch = etree.fromstring(view['arch'])
+        self.assertEqual(
+            arch.find('field[@name="%s"]' % changed.field.name).get('expand'),
+            '3')
+        user_conf = Configurator(user_conf.id)
+        self.assertEqual(
+            [l.field for l in user_conf.effective_lines if l.field],
+            [changed.field] + [l.field for l in group_lines[2:]])
+
+        Configurator.delete([group_conf])
+        user_conf = Configurator(user_conf.id)
+        self.assertIsNone(user_conf.parent)
+        self.assertTrue(user_conf.snapshot)
+        self.assertEqual(get_names(), names)
+
+    @with_transaction()
+    def test_warm_up(self):
+        'Compile the user and group configurators but the unchanged ones'
+        pool = Pool()
+        Configurator = pool.get('view.configurator')
+        Model = pool.get('ir.model')
+        User = pool.get('res.user')
+
+        attachment, = Model.search([
+            ('name', '=', 'ir.attachment')
+            ], limit=1)
+        model_field, = Model.search([
+            ('name', '=', 'ir.model.field')
+            ], limit=1)
+        user = User(Transaction().user)
+        group_conf = Configurator(model=attachment, group=user.groups[0])
+        group_conf.save()
+        # Without lines the user configurator resolves to its parent
+        child = Configurator(
+            Configurator.get_custom_view('ir.attachment', None))
+        user_conf = Configurator(model=model_field, user=user)
+        user_conf.save()
+
+        result = Configurator.warm_up([group_conf, child, user_conf])
+        self.assertEqual(result['compiled'], 2)
+        self.assertEqual(
+            {i for i, _ in result['durations']},
+            {group_conf.id, user_conf.id})
+        self.assertTrue(all(d >= 0 for _, d in result['durations']))
+
+        other, = User.create([{'name': "Other", 'login': 'other'}])
+        with Transaction().set_context(_check_access=True), \
+                Transaction().set_user(other.id):
+            with self.assertRaises(AccessError):
+                Configurator.warm_up([user_conf])
+
+    @with_transaction()
+    def test_stats(self):
+        'Count the misses, hits and lookups and time the compilation'
+        pool = Pool()
+        Configurator = pool.get('view.configurator')
+        Model = pool.get('ir.model')
+        UiView = pool.get('ir.ui.view')
+        Attachment = pool.get('ir.attachment')
+
+        def get_stats():
+            stats = Configurator.get_stats()
+            counters = {
+                name: stats['counters'].get(name, {}).get('ir.attachment', 0)
+                for name in ['hit', 'miss', 'lookup_query']}
+            timer = stats['timers'].get('parse_view', {'count': 0})
+            return counters, timer['count']
+
+        model, = Model.search([
+            ('name', '=', 'ir.attachment')
+            ], limit=1)
+        view, = UiView.search([
+                ('model', '=', 'ir.attachment'),
+                ('type', '=', 'tree'),
+                ('inherit', '=', None),
+                ], limit=1)
+        Configurator(model=model, view=view).save()
+        before, parse_before = get_stats()
+
+        Attachment.fields_view_get(view_type='tree')
+        Attachment.fields_view_get(view_type='tree')
+
+        after, parse_after = get_stats()
+        self.assertEqual(after['miss'] - before['miss'], 1)
+        self.assertEqual(after['hit'] - before['hit'], 1)
+        # The view is looked up once as the resolution is memoized
+        self.assertEqual(
+            after['lookup_query'] - before['lookup_query'], 1)
+        self.assertEqual(parse_after - parse_before, 1)
+        self.assertIn('store', Configurator.get_stats())
+
+    @with_transaction()
+    def test_configurable_model_view(self):
+        'Register the override only on the configurable models'
+        pool = Pool()
+        Configurator = pool.get('view.configurator')
+        Attachment = pool.get('ir.attachment')
+
+        self.assertTrue(issubclass(Attachment, ConfigurableModelView))
+        self.assertTrue(issubclass(Attachment, ModelViewMixin))
+        self.assertFalse(issubclass(Configurator, ConfigurableModelView))
+        self.assertFalse(issubclass(Configurator, ModelViewMixin))
+        self.assertFalse(issubclass(dict, ConfigurableModelView))
+
+    @with_transaction()
+    def test_group_configurator_view(self):
+        'Set the group configurator with or without view as parent'
+        pool = Pool()
+        Configurator = pool.get('view.configurator')
+        ConfiguratorLine = pool.get('view.configurator.line')
+        Model = pool.get('ir.model')
+        ModelField = pool.get('ir.model.field')
+        UiView = pool.get('ir.ui.view')
+        User = pool.get('res.user')
+
+        model, = Model.search([
+            ('name', '=', 'ir.attachment')
+            ], limit=1)
+        field, = ModelField.search([
+            ('model.name', '=', 'ir.attachment'),
+            ('name', '=', 'name'),
+            ])
+        view, = UiView.search([
+                ('model', '=', 'ir.attachment'),
+                ('type', '=', 'tree'),
+                ('inherit', '=', None),
+                ], limit=1)
+        group = User(Transaction().user).groups[0]
+        group_conf = Configurator(model=model, group=group)
+        group_conf.save()
+
+        user_conf = Configurator(
+            Configurator.get_custom_view('ir.attachment', view.id))
+        self.assertEqual(user_conf.view, view)
+        self.assertEqual(user_conf.parent, group_conf)
+        ConfiguratorLine.create([{
+                    'view': user_conf.id,
+                    'type': 'ir.model.field',
+                    'field': field.id,
+                    'expand': 2,
+                    }])
+
+        Configurator.delete([group_conf])
+        user_conf = Configurator(user_conf.id)
+        self.assertIsNone(user_conf.parent)
+        count = len(user_conf.lines)
+        # The columns of the own base view are already in the snapshot
+        Configurator.create_snapshots([user_conf])
+        self.assertEqual(len(Configurator(user_conf.id).lines), count)
+
+        # The group configurator of the view is preferred
+        Configurator.delete([user_conf])
+        group_conf, view_conf = Configurator.create([{
+                    'model': model.id,
+                    'group': group.id,
+                    }, {
+                    'model': model.id,
+                    'group': group.id,
+                    'view': view.id,
+                    }])
+        user_conf = Configurator(
+            Configurator.get_custom_view('ir.attachment', view.id))
+        self.assertEqual(user_conf.parent, view_conf)
+
+    @with_transaction()
+    def test_resolution_memo(self):
+        'Memoize the resolution in the transaction until it is cleared'
+        pool = Pool()
+        Configurator = pool.get('view.configurator')
+        Model = pool.get('ir.model')
+        User = pool.get('res.user')
+
+        model, = Model.search([
+            ('name', '=', 'ir.attachment')
+            ], limit=1)
+        user, = User.search([('login', '=', 'admin')])
+        key = ('ir.attachment', None, 'tree', user.id)
+
+        global_conf = Configurator(model=model)
+        global_conf.save()
+        self.assertEqual(
+            Configurator.resolve_view('ir.attachment', None, 'tree', user.id),
+            global_conf.id)
+        self.assertEqual(
+            _transaction_resolutions[Transaction()][key], global_conf.id)
+        self.assertIsNone(
+            Configurator.resolve_view('ir.attachment', None, 'form', user.id))
+
+        user_conf = Configurator(model=model, user=user)
+        user_conf.save()
+        self.assertNotIn(key, _transaction_resolutions.get(Transaction(), {}))
+        self.assertEqual(
+            Configurator.resolve_view('ir.attachment', None, 'tree', user.id),
+            user_conf.id)
+
+        Configurator.clear_resolution(['ir.attachment'])
+        self.assertNotIn(Transaction(), _transaction_resolutions)
+
+    @with_transaction()
+    def test_tree_optional_overlay(self):
+        'Apply user optional columns on the shared compiled view'
+        pool = Pool()
+        Configurator = pool.get('view.configurator')
+        ConfiguratorLine = pool.get('view.configurator.line')
+        Model = pool.get('ir.model')
+        ModelField = pool.get('ir.model.field')
+        ViewTreeOptional = pool.get('ir.ui.view_tree_optional')
+        Attachment = pool.get('ir.attachment')
+
+        model, = Model.search([
+            ('name', '=', 'ir.attachment')
+            ], limit=1)
+        field, = ModelField.search([
+            ('model.name', '=', 'ir.attachment'),
+            ('name', '=', 'name'),
+            ])
+
+        conf1 = Configurator(model=model)
+        conf1.save()
+        ConfiguratorLine.delete(conf1.lines)
+        conf1 = Configurator(conf1.id)
+        conf1.lines = [{
+            'type': 'ir.model.field',
+            'field': field,
+            'optional': 'show',
+            }]
+        conf1.save()
+
+        view = Attachment.fields_view_get(view_type='tree')
+        arch = etree.fromstring(view['arch'])
+        self.assertEqual(arch.find('field').get('optional'), '0')
+
+        ViewTreeOptional.create([{
+                    'view': view['view_id'],
+                    'user': Transaction().user,
+                    'field': 'name',
+                    'value': True,
+                    }])
+        view = Attachment.fields_view_get(view_type='tree')
+        arch = etree.fromstring(view['arch'])
+        self.assertEqual(arch.find('field').get('optional'), '1')
+
+        ViewTreeOptional.delete(ViewTreeOptional.search([]))
+        view = Attachment.fields_view_get(view_type='tree')
+        arch = etree.fromstring(view['arch'])
+        self.assertEqual(arch.find('field').get('optional'), '0')
+
+    @with_transaction()
+    def test_custom_views(self):
+        'Get and create custom views in bulk'
+        pool = Pool()
+        Configurator = pool.get('view.configurator')
+
+        views = [('ir.attachment', None), ('ir.note', 'null')]
+        result = Configurator.get_custom_views(views)
+        self.assertEqual([r['id'] for r in result], [None, None])
+        self.assertEqual([r['view']['type'] for r in result], ['tree', 'tree'])
+
+        ids = Configurator.create_custom_views(views)
+        self.assertEqual(len(set(ids)), 2)
+        self.assertEqual(Configurator.create_custom_views(views), ids)
+        self.assertEqual(
+            Configurator.get_custom_view('ir.attachment', None), ids[0])
+
+        result = Configurator.get_custom_views(views)
+        self.assertEqual([r['id'] for r in result], ids)
+
+    @with_transaction()
+    def test_resequence(self):
+        'Resequence configurator lines at once'
+        pool = Pool()
+        Configurator = pool.get('view.configurator')
+        Model = pool.get('ir.model')
+
+        model, = Model.search([
+            ('name', '=', 'ir.attachment')
+            ], limit=1)
+        conf1 = Configurator(model=model)
+        conf1.save()
+        line_ids = [l.id for l in conf1.lines]
+        self.assertGreater(len(line_ids), 1)
+
+        Configurator.resequence([conf1], list(reversed(line_ids)))
+        conf1 = Configurator(conf1.id)
+        self.assertEqual(
+            [l.id for l in conf1.lines], list(reversed(line_ids)))
+        self.assertEqual(
+            [l.sequence for l in conf1.lines],
+            list(range(1, len(line_ids) + 1)))
+
+    @with_transaction()
+    def test_export_import(self):
+        'Export and import configurators by name'
+        pool = Pool()
+        Configurator = pool.get('view.configurator')
+        Model = pool.get('ir.model')
+
+        model, = Model.search([
+            ('name', '=', 'ir.attachment')
+            ], limit=1)
+        conf1 = Configurator(model=model)
+        conf1.save()
+        records = list(Configurator.export_configurators([conf1]))
+        self.assertEqual(records[0]['model'], 'ir.attachment')
+        names = [l['name'] for l in records[0]['lines']]
+        Configurator.delete([conf1])
+
+        ids = Configurator.import_configurators(iter(records), chunk_size=1)
+        conf2, = Configurator.browse(ids)
+        self.assertEqual(
+            sorted(l.field.name if l.field else l.button.name
+                for l in conf2.lines),
+            sorted(names))
+        self.assertEqual(len(conf2.snapshot), len(records[0]['snapshot']))
+
+
+class ConfigurableModelsTestCase(unittest.TestCase):
+    'Test the configurable models options'
+
+    def set_option(self, option, value):
+        if not config.has_section('view_configurator'):
+            config.add_section('view_configurator')
+        config.set('view_configurator', option, value)
+        self.addCleanup(config.remove_option, 'view_configurator', option)
+
+    def test_default(self):
+        'Configure all the models but the configurator'
+        self.assertTrue(is_configurable('ir.attachment'))
+        self.assertFalse(is_configurable('view.configurator'))
+
+    def test_models(self):
+        'Configure only the models matching the patterns'
+        self.set_option('models', 'ir.* res.user')
+        self.set_option('exclude_models', 'ir.model.*')
+
+        self.assertTrue(is_configurable('ir.attachment'))
+        self.assertTrue(is_configurable('res.user'))
+        self.assertFalse(is_configurable('ir.model.field'))
+        self.assertFalse(is_configurable('res.group'))
+        self.assertFalse(is_configurable('view.configurator'))
+
+    def test_exclude_models(self):
+        'Configure all the models but the excluded ones'
+        self.set_option('exclude_models', 'res.*, ir.model')
+
+        self.assertTrue(is_configurable('ir.attachment'))
+        self.assertFalse(is_configurable('ir.model'))
+        self.assertFalse(is_configurable('res.user'))
+
+
+def compiled(size, fields=None):
+    "Return a compiled view of size bytes without fields"
+    arch = 'x' * (size - definition_size(()) - definition_size({}))
+    return {'arch': arch, 'fields': fields or {}}, ()
+
+
+class CompiledViewStoreTestCase(unittest.TestCase):
+    'Test the compiled views store'
+
+    def test_lru_eviction(self):
+        'Evict the least recently used views first'
+        store = CompiledViewStore(budget=250, model_budget=250)
+        store.set('a', 'model.a', compiled(100), ('model.a',))
+        store.set('b', 'model.b', compiled(100), ('model.b',))
+        self.assertIsNotNone(store.get('a'))
+        store.set('c', 'model.c', compiled(100), ('model.c',))
+
+        self.assertIsNotNone(store.get('a'))
+        self.assertIsNone(store.get('b'))
+        self.assertIsNotNone(store.get('c'))
+        stats = store.get_stats()
+        self.assertEqual(stats['size'], 200)
+        self.assertEqual(stats['count'], 2)
+        self.assertEqual(stats['models']['model.b']['evictions'], 1)
+
+    def test_model_budget(self):
+        'Evict only the views of the model over its budget'
+        store = CompiledViewStore(budget=1000, model_budget=250)
+        store.set('a1', 'model.a', compiled(100), ('model.a',))
+        store.set('b', 'model.b', compiled(100), ('model.b',))
+        store.set('a2', 'model.a', compiled(100), ('model.a',))
+        store.set('a3', 'model.a', compiled(100), ('model.a',))
+
+        self.assertIsNone(store.get('a1'))
+        self.assertIsNotNone(store.get('a2'))
+        self.assertIsNotNone(store.get('a3'))
+        self.assertIsNotNone(store.get('b'))
+        stats = store.get_stats()
+        self.assertEqual(stats['models']['model.a'], {
+                'size': 200,
+                'count': 2,
+                'evictions': 1,
+                'rejections': 0,
+                })
+        self.assertEqual(stats['models']['model.b']['evictions'], 0)
+
+    def test_rejection(self):
+        'Reject the views larger than the budgets without evicting'
+        store = CompiledViewStore(budget=1000, model_budget=250)
+        store.set('a', 'model.a', compiled(100), ('model.a',))
+        store.set('b', 'model.b', compiled(300), ('model.b',))
+        fields = {'f%s' % i: {'string': 'x' * 40} for i in range(10)}
+        store.set('c', 'model.c', compiled(100, fields), ('model.c',))
+
+        self.assertIsNotNone(store.get('a'))
+        self.assertIsNone(store.get('b'))
+        self.assertIsNone(store.get('c'))
+        stats = store.get_stats()
+        self.assertEqual(stats['size'], 100)
+        self.assertEqual(stats['count'], 1)
+        self.assertEqual(stats['tables'], 1)
+        self.assertEqual(stats['models']['model.b']['rejections'], 1)
+        self.assertEqual(stats['models']['model.c']['rejections'], 1)
+        self.assertEqual(stats['models']['model.a']['evictions'], 0)
+
+    def test_stats(self):
+        'Count the sizes of the views and the shared definitions'
+        store = CompiledViewStore(budget=1000, model_budget=500)
+        definition = {'string': 'Name'}
+        store.set('a', 'model.a', compiled(100), ('model.a',))
+        store.set('b', 'model.a', compiled(100), ('model.a',))
+        store.set('b', 'model.a', compiled(150), ('model.a',))
+
+        stats = store.get_stats()
+        self.assertEqual(stats['budget'], 1000)
+        self.assertEqual(stats['model_budget'], 500)
+        self.assertEqual(stats['size'], 250)
+        self.assertEqual(stats['count'], 2)
+        self.assertEqual(stats['tables'], 1)
+
+        store.clear()
+        store.set('c', 'model.a', ({
+                    'arch': '', 'fields': {'name': definition}}, ()),
+            ('model.a',))
+        stats = store.get_stats()
+        self.assertEqual(stats['size'], (definition_size(definition)
+                + definition_size(('name',)) + definition_size({})))
+        self.assertEqual(stats['models']['model.a']['count'], 1)
+
+    def test_database_stores(self):
+        'Keep a store per database'
+        self.assertIs(compiled_views('db1'), compiled_views('db1'))
+        self.assertIsNot(compiled_views('db1'), compiled_views('db2'))
+
+        compiled_views('db1').set('a', 'model.a', compiled(100), ('model.a',))
+        self.assertIsNone(compiled_views('db2').get('a'))
+        compiled_views('db2').clear()
+        self.assertIsNotNone(compiled_views('db1').get('a'))
+        compiled_views('db1').clear()
+
+    def test_shared_definitions(self):
+        'Share copies of the definitions of a fields key'
+        store = CompiledViewStore(budget=1000, model_budget=1000)
+        name = {'string': 'Name'}
+        store.set('a', 'model.a', ({
+                    'arch': '', 'fields': {'name': name}}, ()),
+            ('model.a',))
+        store.set('b', 'model.a', ({
+                    'arch': '', 'fields': {'name': dict(name)}}, ()),
+            ('model.a',))
+        store.set('c', 'model.a', ({
+                    'arch': '', 'fields': {'name': {'string': 'Other'}}}, ()),
+            ('model.a',))
+        stats = store.get_stats()
+        self.assertEqual(stats['tables'], 1)
+        self.assertEqual(stats['size'], definition_size(name)
+            + 3 * definition_size(('name',))
+            + 2 * definition_size({})
+            + definition_size({'name': {'string': 'Other'}}))
+
+        # The definitions of the caller are not interned
+        name['string'] = 'Changed'
+        self.assertEqual(
+            store.get('b')[0]['fields']['name'], {'string': 'Name'})
+        self.assertIs(
+            store.get('a')[0]['fields']['name'],
+            store.get('b')[0]['fields']['name'])
+        self.assertEqual(
+            store.get('c')[0]['fields']['name'], {'string': 'Other'})
+
+    def test_table_release(self):
+        'Release the table with the last view of its fields key'
+        store = CompiledViewStore(budget=250, model_budget=250)
+        fields = {'name': {'string': 'Name'}}
+        store.set('a', 'model.a', compiled(100, fields), ('model.a',))
+        store.set('b', 'model.a', compiled(100, fields), ('model.a',))
+        store.set('c', 'model.b', compiled(100), ('model.b',))
+        stats = store.get_stats()
+        self.assertEqual(stats['tables'], 2)
+        self.assertEqual(stats['count'], 2)
+        self.assertIsNone(store.get('a'))
+
+        store.set('d', 'model.c', compiled(100), ('model.c',))
+        stats = store.get_stats()
+        self.assertIsNone(store.get('b'))
+        self.assertEqual(stats['tables'], 2)
+        self.assertEqual(stats['size'], 200)
+        self.assertEqual(stats['models']['model.a']['size'], 0)
+
+
+class SingleFlightTestCase(unittest.TestCase):
+    'Test the single flight of the compilations'
+
+    def test_first_caller(self):
+        'Run the block of the first caller at once'
+        with single_flight('key'):
+            self.assertIn('key', _flights)
+        self.assertNotIn('key', _flights)
+
+    def test_concurrent_caller(self):
+        'Make the concurrent caller wait and use the first result'
+        results = {}
+        compilations = []
+        entered, started = threading.Event(), threading.Event()
+
+        def get():
+            with single_flight('key'):
+                if 'key' not in results:
+                    compilations.append(threading.current_thread())
+                    entered.set()
+                    # Let the other caller wait for the block
+                    started.wait(5)
+                    results['key'] = 'compiled'
+
+        first = threading.Thread(target=get)
+        first.start()
+        entered.wait(5)
+        second = threading.Thread(target=get)
+        second.start()
+        deadline = time.monotonic() + 5
+        while _flights['key'][1] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(_flights['key'][1], 2)
+        started.set()
+        first.join(5)
+        second.join(5)
+
+        self.assertEqual(compilations, [first])
+        self.assertEqual(results, {'key': 'compiled'})
+        self.assertNotIn('key', _flights)
+
+
 del ModuleTestCase
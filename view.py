@@ -1,8 +1,57 @@
-from trytond.pool import PoolMeta
+from weakref import WeakKeyDictionary
 
+from trytond.pool import Pool, PoolMeta
+from trytond.transaction import Transaction
 
-class View(metaclass=PoolMeta):
+from .configurator import CompiledViewsClearMixin
+
+_queued_models = WeakKeyDictionary()
+
+
+class View(CompiledViewsClearMixin, metaclass=PoolMeta):
     __name__ = 'ir.ui.view'
 
     def get_rec_name(self, name):
         return super().get_rec_name(name) + " (%s)" % self.name
+
+    @property
+    def _is_tree(self):
+        view = self
+        while view.inherit:
+            view = view.inherit
+        return view.type == 'tree'
+
+    @classmethod
+    def _queue_snapshot_refresh(cls, model_names):
+        "Queue the snapshot refresh of the models once per transaction"
+        pool = Pool()
+        ViewConfigurator = pool.get('view.configurator')
+        queued = _queued_models.setdefault(Transaction(), set())
+        model_names = set(filter(None, model_names)) - queued
+        if model_names:
+            queued.update(model_names)
+            ViewConfigurator.queue_snapshot_refresh(model_names)
+
+    @classmethod
+    def create(cls, vlist):
+        views = super().create(vlist)
+        cls._queue_snapshot_refresh(v.model for v in views if v._is_tree)
+        return views
+
+    @classmethod
+    def write(cls, *args):
+        actions = iter(args)
+        all_views = []
+        for views, _ in zip(actions, actions):
+            all_views.extend(views)
+        # The model of a view may be changed by the write
+        models = {v.model for v in all_views if v._is_tree}
+        super().write(*args)
+        cls._queue_snapshot_refresh(models
+            | {v.model for v in cls.browse(all_views) if v._is_tree})
+
+    @classmethod
+    def delete(cls, views):
+        models = {v.model for v in views if v._is_tree}
+        super().delete(views)
+        cls._queue_snapshot_refresh(models)